@@ -1,9 +1,20 @@
+import argparse
 import os
 import shutil
+import sys
 
+from src.helpers import profiling
+from src.helpers.archives import is_archive, is_sink_path
+from src.helpers.assets import COPY, STRATEGIES, AssetCopier
+from src.helpers.isolation import QUARANTINE_NAME, load_quarantine
+from src.helpers.planning import scan_tree
+from src.helpers.runner import run_files, run_stream
+from src.helpers.service import ConversionService, ServiceClient, ServiceError
+from src.helpers.sharding import WorkQueue, parse_shard
+from src.helpers.verify import verify_outputs
+from src.service.backend import BACKENDS, STDLIB
 from src.service.process import IProcess
-from src.service.process_html import ProcessHtml
-from src.service.process_xml import ProcessXML
+from src.service.registry import PROCESSORS, ProcessorRegistry
 
 
 def process_xml_files(process_object: IProcess, input_xml_folder, output_html_folder, input_type, out_type):
@@ -22,7 +33,7 @@ def process_xml_files(process_object: IProcess, input_xml_folder, output_html_fo
             process_xml_files(process_object, input_path, output_path, input_type, out_type)
         elif item.endswith(input_type):
             # If the item is an XML file, process it
-            process_object.process_file(input_path, output_path.replace(input_type, out_type))
+            process_object.process_file(input_path, output_path[:len(output_path) - len(input_type)] + out_type)
         else:
             # If the item is not an XML file, copy it to the output folder
             shutil.copy2(input_path, output_path)
@@ -31,8 +42,192 @@ def process_xml_files(process_object: IProcess, input_xml_folder, output_html_fo
 INPUT_FOLDER = 'input'
 OUTPUT_FOLDER = 'output'
 INPUT_TYPE = '.html'  #.xml
-OUTPUT_TYPE = '.json'  #.html
+WORKERS = 1
+# Seconds after which an unfinished work queue claim is taken to belong to a crashed machine
+QUEUE_LEASE = 3600
+# Dispatch every input type the registry knows in one walk, each to its default output type
+ALL_TYPES = 'all'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Convert case law XML and legislation HTML trees')
+    parser.add_argument('--input', default=INPUT_FOLDER, help='input folder, or a .zip/.tar/.tar.gz archive')
+    parser.add_argument('--output', default=OUTPUT_FOLDER,
+                        help='output folder, or a .zip/.tar/.tar.gz path to write archive shards instead of a tree, '
+                             'or a .jsonl path to write one compact record per document with an id index')
+    parser.add_argument('--input-type', default=INPUT_TYPE, choices=sorted(PROCESSORS) + [ALL_TYPES],
+                        help=f'type of the files to process, {ALL_TYPES} processes every known type in one walk '
+                             f'and ignores --output-type')
+    parser.add_argument('--output-type',
+                        help='extension of the outputs, by default the one the processor of --input-type writes')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='number of worker processes, 0 uses every core, 1 processes files in this process')
+    parser.add_argument('--incremental', action='store_true',
+                        help='skip inputs unchanged since the last run and prune outputs of deleted inputs')
+    parser.add_argument('--backend', default=STDLIB, choices=BACKENDS,
+                        help='parser backend, lxml and auto fall back to the stdlib parsers when lxml is missing')
+    parser.add_argument('--restricted-parse', action='store_true',
+                        help='only build the parts of legislation pages the extractors read')
+    parser.add_argument('--compact-json', action='store_true', help='write statute JSON without indentation')
+    parser.add_argument('--profile', action='store_true', help='time each processing stage and report a breakdown')
+    parser.add_argument('--profile-output', help='also write the stage breakdown and slowest files as JSON')
+    parser.add_argument('--profile-slowest', type=int, default=10, help='number of slowest files to report')
+    parser.add_argument('--progress-interval', type=float, default=30.0,
+                        help='seconds between progress lines on stderr, 0 disables them')
+    parser.add_argument('--telemetry', help='write run telemetry (throughput, counts, duration) to this JSON file')
+    parser.add_argument('--prometheus', help='write run telemetry in Prometheus text format to this file')
+    parser.add_argument('--template', help='alternate Jinja template file for case HTML')
+    parser.add_argument('--template-cache', help='directory for compiled bytecode of --template')
+    parser.add_argument('--stream-threshold', type=int,
+                        help='stream XML files of at least this many bytes with iterparse, 0 streams every file')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, converting and writing files instead of one file at a time')
+    parser.add_argument('--io-threads', type=int, default=4, help='reader threads of --pipeline')
+    parser.add_argument('--prefetch', type=int, default=16, help='files --pipeline keeps in flight per stage')
+    parser.add_argument('--shard-files', type=int,
+                        help='start a new output archive or JSON Lines shard after this many files')
+    parser.add_argument('--shard-bytes', type=int,
+                        help='start a new output archive or JSON Lines shard once one holds this many bytes')
+    parser.add_argument('--shard', type=parse_shard,
+                        help='only handle the files whose relative path hashes to shard i of N, given as i/N')
+    parser.add_argument('--queue',
+                        help='claim files from a work queue in this shared folder instead of a fixed --shard')
+    parser.add_argument('--queue-lease', type=float, default=QUEUE_LEASE, metavar='SECONDS',
+                        help='take over queue claims left unfinished this long, by a machine that crashed')
+    parser.add_argument('--verify', nargs='+', metavar='OUTPUT',
+                        help='check that these shard output folders together hold one output per input, then exit')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the planned files and bytes per type and the largest inputs, then exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep warm processors for every input type and convert JSON-lines jobs from stdin, or '
+                             'from --socket, until closed')
+    parser.add_argument('--socket', help='Unix socket path for --serve and --submit')
+    parser.add_argument('--submit', nargs='+', metavar='FILE',
+                        help='convert these files with the service on --socket, writing the outputs to --output')
+    parser.add_argument('--assets', default=COPY, choices=STRATEGIES,
+                        help='how files that are not converted reach the output, linking or cloning falls back to '
+                             'copying where the filesystem does not support it')
+    parser.add_argument('--skip-identical-assets', action='store_true',
+                        help='leave assets whose output already has the same size and modification time')
+    parser.add_argument('--exclude', action='append', default=[], metavar='PATTERN',
+                        help='do not mirror assets whose relative path or name matches this glob, repeatable')
+    parser.add_argument('--dedup', nargs='?', const=COPY, choices=STRATEGIES,
+                        help='convert byte-identical inputs once and place the output at every copy\'s destination '
+                             'by copying it, or by the given link strategy')
+    parser.add_argument('--timeout', type=float,
+                        help='seconds one file may take, it runs in an isolated worker that is killed past that')
+    parser.add_argument('--memory-limit', type=int, metavar='MB',
+                        help='megabytes of address space one file may add to its isolated worker')
+    parser.add_argument('--quarantine',
+                        help=f'write failed files with traceback and elapsed time to this JSON file, by default '
+                             f'{QUARANTINE_NAME} in the output folder when --timeout or --memory-limit is given')
+    parser.add_argument('--retry-failures', action='store_true',
+                        help='only process the files listed in the quarantine file of an earlier run')
+    parser.add_argument('--merge-into', help='with --verify, also copy every verified output into this folder')
+    args = parser.parse_args()
+    if args.output_type is None and args.input_type != ALL_TYPES:
+        args.output_type = PROCESSORS[args.input_type][2]
+    args.streamed = (is_archive(args.input) or is_sink_path(args.output) or args.shard_files is not None
+                     or args.shard_bytes is not None)
+    if args.streamed and args.incremental:
+        parser.error('--incremental needs a folder input and a folder output')
+    if args.dry_run and is_archive(args.input):
+        parser.error('--dry-run plans folder inputs only')
+    if args.verify and is_archive(args.input):
+        parser.error('--verify checks outputs against folder inputs only')
+    isolated = args.timeout or args.memory_limit
+    if (isolated or args.retry_failures) and (args.streamed or args.pipeline):
+        parser.error('--timeout, --memory-limit and --retry-failures need folder runs without --pipeline')
+    if args.retry_failures and args.incremental:
+        parser.error('--retry-failures cannot be combined with --incremental')
+    if args.quarantine is None and (isolated or args.retry_failures):
+        args.quarantine = os.path.join(args.output, QUARANTINE_NAME)
+    args.retry_inputs = None
+    if args.retry_failures:
+        try:
+            args.retry_inputs = load_quarantine(args.quarantine)
+        except FileNotFoundError:
+            parser.error(f'--retry-failures found no quarantine file at {args.quarantine}')
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            parser.error(f'--retry-failures cannot read {args.quarantine}: {error}')
+    if args.streamed and (args.dedup or args.assets != COPY or args.skip_identical_assets):
+        parser.error('--dedup, --assets and --skip-identical-assets need a folder input and a folder output')
+    if args.queue and (args.streamed or args.incremental or args.shard):
+        parser.error('--queue works on folder inputs and outputs and replaces --shard and --incremental')
+    return args
+
+
+def build_registry(args, input_type=None):
+    # Processors are only described here, the registry imports and builds them when their files turn up
+    input_type = input_type or args.input_type
+    types = None if input_type == ALL_TYPES else {input_type: args.output_type}
+    options = {
+        '.html': dict(backend=args.backend, restricted=args.restricted_parse, compact=args.compact_json),
+        '.xml': dict(template_path=args.template, template_cache=args.template_cache,
+                     stream_threshold=args.stream_threshold, backend=args.backend),
+    }
+    return ProcessorRegistry(types, options)
+
+
+def submit_files(args):
+    failed = 0
+    output_types = ProcessorRegistry().types
+    with ServiceClient.connect(args.socket, timeout=10) as client:
+        for path in args.submit:
+            stem, input_type = os.path.splitext(os.path.basename(path))
+            output_path = os.path.join(args.output, stem + output_types.get(input_type, args.output_type))
+            try:
+                client.convert(path=path, output=output_path)
+                print(f'{path} -> {output_path}')
+            except ServiceError as error:
+                failed += 1
+                print(f'Failed to process {path}: {error}', file=sys.stderr)
+    return failed
+
+
 if __name__ == '__main__':
-    process = ProcessHtml()  # uncomment if you want to process html for legislature
-    # process = ProcessXML()  # uncomment if you want to process xml for case
-    process_xml_files(process, INPUT_FOLDER, OUTPUT_FOLDER, INPUT_TYPE, OUTPUT_TYPE)
+    args = parse_args()
+    if args.verify:
+        report = verify_outputs(args.input, args.verify, build_registry(args), args.merge_into,
+                                AssetCopier(exclude=args.exclude))
+        sys.exit(0 if report.ok else 1)
+    if args.dry_run:
+        scan_tree(args.input, args.output, build_registry(args)).select_shard(
+            args.input, args.shard).largest_first().report()
+        sys.exit(0)
+    if args.serve:
+        service = ConversionService(build_registry(args, ALL_TYPES))
+        if args.socket:
+            try:
+                service.serve_unix(args.socket)
+            except ServiceError as error:
+                print(error, file=sys.stderr)
+                sys.exit(1)
+        else:
+            service.serve_stdio()
+        sys.exit(0)
+    if args.submit:
+        os.makedirs(args.output, exist_ok=True)
+        sys.exit(1 if submit_files(args) else 0)
+    registry = build_registry(args)
+    copier = AssetCopier(args.assets, args.skip_identical_assets, args.exclude)
+    collector = profiling.Collector(args.profile_slowest) if args.profile or args.profile_output else None
+    if args.streamed:
+        summary = run_stream(registry, args.input, args.output, workers=args.workers or None, profile=collector,
+                             progress_interval=args.progress_interval, telemetry_path=args.telemetry,
+                             prometheus_path=args.prometheus, shard_files=args.shard_files,
+                             shard_bytes=args.shard_bytes, prefetch=args.prefetch, shard=args.shard, assets=copier)
+    else:
+        summary = run_files(registry, args.input, args.output, workers=args.workers or None,
+                            incremental=args.incremental, profile=collector, progress_interval=args.progress_interval,
+                            telemetry_path=args.telemetry, prometheus_path=args.prometheus, pipeline=args.pipeline,
+                            io_threads=args.io_threads, prefetch=args.prefetch, shard=args.shard,
+                            queue=WorkQueue(args.queue, args.queue_lease) if args.queue else None,
+                            assets=copier, dedup=AssetCopier(args.dedup) if args.dedup else None,
+                            timeout=args.timeout,
+                            memory_limit=args.memory_limit * 2 ** 20 if args.memory_limit else None,
+                            quarantine_path=args.quarantine, only=args.retry_inputs)
+    if collector is not None and args.profile_output:
+        collector.dump(args.profile_output)
+    # Failed files are reported per file without stopping the run, the exit status tells schedulers about them
+    sys.exit(1 if summary.failures else 0)
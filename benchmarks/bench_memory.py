@@ -0,0 +1,46 @@
+import gc
+import json
+import sys
+import tracemalloc
+
+from src.parser.json_template import Image, Statute, Table
+
+
+def build_statute(sections, tables_per_section, rows, cols):
+    # A large Act: every section carries tables, the schedule carries tables and images
+    statute = Statute(title='Synthetic Act', statuteId='2024 c. 1')
+    for number in range(sections):
+        tables = [Table(name=f'tbl-{number}-{t}',
+                        rows=[[f'r{r}c{c}' for c in range(cols)] for r in range(rows)])
+                  for t in range(tables_per_section)]
+        statute.add_section(title=f'Section {number}', key=str(number), content=f'Text of section {number}. ' * 20,
+                            tables=tables)
+    statute.add_schedule(content='Schedule text', tables=[Table(name='schedule', rows=[['a', 'b']] * rows)],
+                         images=[Image(altText='Schedule', link=f'img{i}.png', name=f'image_{i}') for i in range(50)])
+    return statute
+
+
+def retained(build):
+    # Bytes still allocated once `build` returns, i.e. the size of the object graph it produced
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, size
+
+
+def main(sections=2000, tables_per_section=2, rows=20, cols=5):
+    statute, slotted = retained(lambda: build_statute(sections, tables_per_section, rows, cols))
+    # The dict and list layout Statute used to keep in memory, rebuilt from the same document
+    document = statute.to_json()
+    legacy_dicts, legacy = retained(lambda: json.loads(document))
+    assert legacy_dicts == json.loads(statute.to_json())
+    print(f'dict model:    {legacy / 1024 / 1024:8.1f} MiB')
+    print(f'slotted model: {slotted / 1024 / 1024:8.1f} MiB ({slotted / legacy:.0%} of the dict model)')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.run import TIERS, percentile
+from benchmarks.synthetic import generate_judgment, generate_legislation
+from src.helpers.service import ServiceClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(ROOT, 'app.py')
+
+
+def write_inputs(scratch, jobs, tier):
+    # One folder per job, as the ingestion system triggers one document at a time
+    paths = []
+    for number in range(jobs):
+        folder = os.path.join(scratch, 'in', str(number))
+        os.makedirs(folder)
+        if number % 2:
+            path = os.path.join(folder, 'judgment.xml')
+            text = generate_judgment(seed=number, **TIERS[tier]['judgment'])
+        else:
+            path = os.path.join(folder, 'act.html')
+            text = generate_legislation(seed=number, **TIERS[tier]['legislation'])
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        paths.append(path)
+    return paths
+
+
+def timed(fn, paths):
+    latencies = []
+    for path in paths:
+        started = time.perf_counter()
+        fn(path)
+        latencies.append(time.perf_counter() - started)
+    return sorted(latencies)
+
+
+def spawn_per_job(scratch):
+    def run(path):
+        subprocess.run([sys.executable, APP, '--input', os.path.dirname(path),
+                        '--output', os.path.join(scratch, 'spawn', os.path.basename(os.path.dirname(path))),
+                        '--input-type', os.path.splitext(path)[1], '--progress-interval', '0'],
+                       check=True, cwd=ROOT, stdout=subprocess.DEVNULL)
+    return run
+
+
+def through_client(client, scratch, mode):
+    def run(path):
+        input_type = os.path.splitext(path)[1]
+        output = os.path.join(scratch, mode, os.path.basename(os.path.dirname(path))
+                              + ('.html' if input_type == '.xml' else '.json'))
+        client.convert(path=path, output=output)
+    return run
+
+
+def main(jobs=20, tier='small'):
+    jobs = int(jobs)
+    with tempfile.TemporaryDirectory() as scratch:
+        paths = write_inputs(scratch, jobs, tier)
+        for mode in ('spawn', 'stdio', 'socket'):
+            os.makedirs(os.path.join(scratch, mode))
+        results = {'spawn per job': timed(spawn_per_job(scratch), paths)}
+
+        with ServiceClient.spawn([sys.executable, APP, '--serve']) as client:
+            run = through_client(client, scratch, 'stdio')
+            run(paths[0])  # the first job compiles the template and imports lazily loaded parsers
+            results['service over stdio'] = timed(run, paths)
+
+        socket_path = os.path.join(scratch, 'service.sock')
+        server = subprocess.Popen([sys.executable, APP, '--serve', '--socket', socket_path], cwd=ROOT,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            with ServiceClient.connect(socket_path, timeout=30) as client:
+                run = through_client(client, scratch, 'socket')
+                run(paths[0])
+                results['service over socket'] = timed(run, paths)
+        finally:
+            server.terminate()
+            server.wait()
+
+    baseline = percentile(results['spawn per job'], 0.5)
+    print(f'{jobs} {tier} jobs, alternating judgments and Acts')
+    for name, latencies in results.items():
+        median = percentile(latencies, 0.5)
+        print(f'{name:>20}: p50 {median * 1000:8.1f} ms  p90 {percentile(latencies, 0.9) * 1000:8.1f} ms  '
+              f'{baseline / median:6.1f}x')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,41 @@
+import sys
+import timeit
+
+from jinja2 import Template
+
+from src.parser.html_template import html_template
+from src.parser.templates import get_case_template
+
+CONTEXT = {
+    'title': '<p>Smith v Jones</p>',
+    'date': '<p>2021-03-04</p>',
+    'case_id': 'A1/2020/0001',
+    'court': '<p>EWCA</p>',
+    'court_location': '<p>United Kingdom</p>',
+    'judges': '<p>LORD JUSTICE SMITH</p>',
+    'presiding_judge': '<p>LORD JUSTICE SMITH</p>',
+    'parties': '<p>SMITH</p><p>v</p><p>JONES</p>',
+    'source': '<p>UK CASE LAW NATIONAL ARCHIVES</p>',
+    'media_nuetral_citation': '<p>[2021] EWCA Civ 1</p>',
+    'headnotes': '<p>Headnote</p>',
+    'content': ''.join(f'<p id="{i}">Paragraph {i} of the judgment.</p>' for i in range(200)),
+}
+
+
+def render_per_file():
+    return Template(html_template).render(**CONTEXT)
+
+
+def render_cached():
+    return get_case_template().render(**CONTEXT)
+
+
+def main(number=2000):
+    assert render_per_file() == render_cached()
+    for name, fn in (('compile per file', render_per_file), ('compiled once', render_cached)):
+        seconds = min(timeit.repeat(fn, number=number, repeat=3))
+        print(f'{name:>18}: {seconds / number * 1e6:9.1f} us per render')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
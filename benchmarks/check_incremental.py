@@ -0,0 +1,55 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_corpus
+from src.helpers.runner import run_files
+from src.parser.html_template import html_template
+from src.service.registry import PROCESSORS, ProcessorRegistry
+
+# The documented workflow: one pass per input type into the same output folder
+PASSES = ('.xml', '.html')
+
+
+def run_passes(input_folder, output_folder, options=None):
+    # Returns (input type, processed, copied, skipped) for every pass, with the run reports silenced
+    results = []
+    for input_type in PASSES:
+        registry = ProcessorRegistry({input_type: PROCESSORS[input_type][2]}, options)
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = run_files(registry, input_folder, output_folder, workers=1, incremental=True,
+                                progress_interval=0)
+        results.append((input_type, summary.processed, summary.copied, summary.skipped))
+    return results
+
+
+def main():
+    # Runs the xml and html passes twice over a fixture corpus, the second round must skip every input. Then
+    # edits the --template file of the judgments, after which the xml pass must convert them again.
+    with tempfile.TemporaryDirectory() as scratch:
+        input_folder = os.path.join(scratch, 'input')
+        output_folder = os.path.join(scratch, 'output')
+        template_path = os.path.join(scratch, 'case.html')
+        with open(template_path, 'w', encoding='utf-8') as file:
+            file.write(html_template)
+        options = {'.xml': {'template_path': template_path}}
+        paths = write_corpus(input_folder)
+        run_passes(input_folder, output_folder, options)
+        failed = False
+        for input_type, processed, copied, skipped in run_passes(input_folder, output_folder, options):
+            print(f'{input_type}: rerun processed {processed}, copied {copied}, skipped {skipped} of {len(paths)}')
+            failed = failed or processed or copied or skipped != len(paths)
+
+        with open(template_path, 'a', encoding='utf-8') as file:
+            file.write('<!-- edited -->\n')
+        judgments = sum(path.endswith('.xml') for path in paths)
+        _, processed, _, _ = run_passes(input_folder, output_folder, options)[0]
+        print(f'.xml: after a template edit processed {processed} of {judgments} judgments')
+        failed = failed or processed != judgments
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
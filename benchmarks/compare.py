@@ -0,0 +1,39 @@
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as file:
+        return {result['name']: result for result in json.load(file)['results']}
+
+
+def compare(baseline, candidate, metric, threshold):
+    # Lists every benchmark present in both runs, flagging the ones slower than baseline by over `threshold`
+    regressions = []
+    for name in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[name][metric]
+        after = candidate[name][metric]
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f'{name:<40} {before:10.2f} -> {after:10.2f} {metric}  {change:+7.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--metric', default='p50_ms')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown, 0.10 is 10%%')
+    args = parser.parse_args()
+    regressions = compare(load(args.baseline), load(args.candidate), args.metric, args.threshold)
+    print(f'{len(regressions)} regressions above {args.threshold:.0%}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import os
+import sys
+import tempfile
+
+from benchmarks.synthetic import write_corpus
+from src.service.backend import LXML, lxml_etree
+from src.service.process_html import ProcessHtml
+from src.service.process_xml import ProcessXML
+
+PROCESSORS = {
+    '.xml': ProcessXML,
+    '.html': ProcessHtml,
+}
+# Processing modes that must reproduce the default output, with the input types they apply to
+MODES = {
+    'lxml': (('.xml', '.html'), {'backend': LXML}),
+    'restricted': (('.html',), {'restricted': True}),
+}
+
+
+def render(process_object, input_path, output_path):
+    process_object.process_file(input_path, output_path)
+    with open(output_path, 'rb') as file:
+        return file.read()
+
+
+def compare_corpus(corpus_folder, mode):
+    # Run every fixture with the default processor and with the mode, list the files whose outputs differ
+    input_types, options = MODES[mode]
+    mismatches = []
+    checked = 0
+    with tempfile.TemporaryDirectory() as scratch:
+        output_path = os.path.join(scratch, 'output')
+        for current, dirs, files in os.walk(corpus_folder):
+            for item in sorted(files):
+                input_type = os.path.splitext(item)[1]
+                if input_type not in input_types:
+                    continue
+                processor = PROCESSORS[input_type]
+                input_path = os.path.join(current, item)
+                expected = render(processor(), input_path, output_path)
+                actual = render(processor(**options), input_path, output_path)
+                checked += 1
+                if expected != actual:
+                    mismatches.append(input_path)
+    return checked, mismatches
+
+
+def main(corpus_folder=None, *modes):
+    # Without a corpus folder the modes are compared over a generated corpus of synthetic judgments and Acts
+    if corpus_folder is None:
+        with tempfile.TemporaryDirectory() as scratch:
+            write_corpus(scratch, judgments=10, acts=10)
+            return main(scratch, *modes)
+    modes = list(modes or MODES)
+    if lxml_etree() is None and 'lxml' in modes:
+        print('lxml is not installed, skipping the lxml comparison')
+        modes.remove('lxml')
+    failed = False
+    for mode in modes:
+        checked, mismatches = compare_corpus(corpus_folder, mode)
+        for input_path in mismatches:
+            print(f'{mode}: outputs differ: {input_path}')
+        print(f'{mode}: compared {checked} files, {len(mismatches)} differ')
+        failed = failed or bool(mismatches) or not checked
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*sys.argv[1:]))
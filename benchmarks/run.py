@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import generate_judgment, generate_legislation
+from src.parser.json_template import Statute
+from src.service import process_html, process_xml
+from src.service.backend import parse_xml
+
+TIERS = {
+    'small': {
+        'judgment': {'paragraphs': 20, 'levels': 2, 'judges': 1, 'parties': 2},
+        'legislation': {'sections': 10, 'tables': 1, 'images': 1, 'schedules': 1},
+    },
+    'medium': {
+        'judgment': {'paragraphs': 200, 'levels': 10, 'judges': 3, 'parties': 4},
+        'legislation': {'sections': 100, 'tables': 10, 'images': 5, 'schedules': 2},
+    },
+    'large': {
+        'judgment': {'paragraphs': 2000, 'levels': 40, 'judges': 5, 'parties': 6},
+        'legislation': {'sections': 1000, 'tables': 50, 'images': 20, 'schedules': 5},
+    },
+}
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def measure(fn, repeat):
+    fn()  # warm caches such as the compiled template before timing
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def summarize(name, tier, document_format, input_bytes, latencies, peak=None):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    result = {
+        'name': f'{document_format}/{tier}/{name}',
+        'tier': tier,
+        'format': document_format,
+        'stage': name,
+        'input_bytes': input_bytes,
+        'runs': len(latencies),
+        'mean_ms': total / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'files_per_s': len(latencies) / total if total else None,
+        'mb_per_s': input_bytes * len(latencies) / total / 1e6 if total else None,
+    }
+    if peak is not None:
+        result['peak_kib'] = peak / 1024
+    return result
+
+
+def judgment_cases(input_path, output_path):
+    processor = process_xml.ProcessXML()
+    index = process_xml.DocumentIndex(parse_xml(input_path))
+    decision = index.find('decision')
+    return {
+        'process_file': lambda: processor.process_file(input_path, output_path),
+        'parse': lambda: process_xml.DocumentIndex(parse_xml(input_path)),
+        # A fresh index each time so the memoized header text is measured, not reused
+        'get_head_note': lambda: process_xml.get_head_note(process_xml.DocumentIndex(index.find('header'))),
+        'get_judges': lambda: process_xml.get_judges(process_xml.DocumentIndex(index.find('header'))),
+        'get_parties': lambda: process_xml.get_parties(index),
+        'get_content': lambda: process_xml.get_content(decision),
+    }
+
+
+def legislation_cases(input_path, output_path):
+    processor = process_html.ProcessHtml()
+    with open(input_path, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+    index = process_html.SoupIndex(BeautifulSoup(html_content, 'html.parser'))
+    return {
+        'process_file': lambda: processor.process_file(input_path, output_path),
+        'parse': lambda: process_html.SoupIndex(BeautifulSoup(html_content, 'html.parser')),
+        'get_list_sections': lambda: process_html.get_list_sections(index),
+        'get_section': lambda: process_html.get_section(index, Statute()),
+        'extract_schedule': lambda: process_html.extract_schedule(index, Statute()),
+    }
+
+
+def run(tiers, repeat, scratch):
+    results = []
+    for tier in tiers:
+        for document_format, generate, suffix, cases in (
+                ('judgment', generate_judgment, '.xml', judgment_cases),
+                ('legislation', generate_legislation, '.html', legislation_cases)):
+            input_path = os.path.join(scratch, f'{document_format}-{tier}{suffix}')
+            output_path = input_path + '.out'
+            with open(input_path, 'w', encoding='utf-8') as file:
+                file.write(generate(**TIERS[tier][document_format]))
+            input_bytes = os.path.getsize(input_path)
+            for name, fn in cases(input_path, output_path).items():
+                latencies = measure(fn, repeat)
+                peak = peak_memory(fn) if name == 'process_file' else None
+                result = summarize(name, tier, document_format, input_bytes, latencies, peak)
+                results.append(result)
+                print(f"{result['name']:<40} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms"
+                      + (f"  peak {result['peak_kib']:9.0f} KiB" if peak is not None else ''))
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark ProcessXML and ProcessHtml on synthetic documents')
+    parser.add_argument('--tiers', nargs='+', default=list(TIERS), choices=list(TIERS))
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', default='benchmark-results.json', help='machine readable results file')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as scratch:
+        results = run(args.tiers, args.repeat, scratch)
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
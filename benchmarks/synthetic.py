@@ -0,0 +1,113 @@
+import os
+import random
+from xml.sax.saxutils import escape
+
+AKN_NAMESPACE = 'http://docs.oasis-open.org/legaldocml/ns/akn/3.0'
+UK_NAMESPACE = 'https://caselaw.nationalarchives.gov.uk/akn'
+
+WORDS = ('court', 'appeal', 'judgment', 'claimant', 'defendant', 'evidence', 'statute', 'section', 'order',
+         'tribunal', 'respondent', 'applicant', 'contract', 'liability', 'damages', 'costs', 'reasonable',
+         'the', 'of', 'and', 'that', 'which', 'was', 'in', 'to', 'a', 'for', 'not', 'by', 'with')
+SURNAMES = ('SMITH', 'JONES', 'TAYLOR', 'BROWN', 'WILLIAMS', 'WILSON', 'JOHNSON', 'DAVIES', 'ROBINSON', 'WRIGHT')
+
+
+def sentence(rng, words=20):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def generate_judgment(paragraphs=50, levels=5, judges=3, parties=2, seed=0):
+    # An Akoma Ntoso judgment shaped like the National Archives case law feed: metadata, a header with the
+    # citation, case number, judges and parties, and a decision of numbered paragraphs grouped in levels
+    rng = random.Random(seed)
+    judge_names = [f'LORD JUSTICE {rng.choice(SURNAMES)} {rng.choice(SURNAMES)}' for _ in range(judges)]
+    party_names = [f'{rng.choice(SURNAMES)} {rng.choice(("LTD", "PLC", "LLP"))}' for _ in range(parties)]
+    header = [
+        '<p>Neutral Citation Number: <neutralCitation>[2021] EWCA Civ 1</neutralCitation></p>',
+        '<p>Case No: <b>A1/2021/0001</b></p>',
+        '<p>IN THE COURT OF APPEAL<br/>CIVIL DIVISION</p>',
+        '<p>Before :</p>',
+    ]
+    header += [f'<p>{name}</p>' for name in judge_names]
+    header.append('<p>Between :</p>')
+    for number, name in enumerate(party_names):
+        role = 'Appellant' if number % 2 == 0 else 'Respondent'
+        header.append(f'<p><party refersTo="#p{number}" role="#r{number}">{name}</party></p>')
+        header.append(f'<p><role refersTo="#r{number}">{role}</role></p>')
+
+    def paragraph(number):
+        return (f'<paragraph eId="para_{number}"><num>{number}.</num><content>'
+                f'<p>{escape(sentence(rng))} <i>{escape(sentence(rng, 5))}</i><br/>{escape(sentence(rng))}</p>'
+                f'</content></paragraph>')
+
+    decision = []
+    per_level = paragraphs // (levels + 1) if levels else 0
+    number = 1
+    for level in range(levels):
+        inner = ''.join(paragraph(number + offset) for offset in range(per_level))
+        decision.append(f'<level><heading>Part {level + 1}</heading>{inner}</level>')
+        number += per_level
+    decision += [paragraph(n) for n in range(number, paragraphs + 1)]
+
+    return (f'<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<akomaNtoso xmlns="{AKN_NAMESPACE}" xmlns:uk="{UK_NAMESPACE}"><judgment name="judgment"><meta>'
+            f'<identification source="#tna"><FRBRWork><FRBRdate date="2021-03-04" name="judgment"/>'
+            f'<FRBRname value="{party_names[0] if party_names else "A"} v {party_names[-1] if party_names else "B"}"/>'
+            f'</FRBRWork></identification><references source="#tna">'
+            f'<TLCOrganization eId="ewca" href="#" showAs="Court of Appeal" shortForm="EWCA"/></references>'
+            f'</meta><header>{"".join(header)}</header><judgmentBody><decision>{"".join(decision)}</decision>'
+            f'</judgmentBody></judgment></akomaNtoso>\n')
+
+
+def _table(rng, name, rows, cols):
+    head = ''.join(f'<th>Heading {c}</th>' for c in range(cols))
+    body = ''.join('<tr>' + ''.join(f'<td>{rng.randint(0, 9999)}</td>' for _ in range(cols)) + '</tr>'
+                   for _ in range(rows))
+    return (f'<div><div class="LegTabular" id="{name}"><table><thead><tr>{head}</tr></thead>'
+            f'<tbody>{body}</tbody></table></div></div>')
+
+
+def generate_legislation(sections=50, tables=5, images=2, schedules=1, table_rows=10, table_cols=4, seed=0):
+    # A legislation.gov.uk style Act page: site chrome, prelims, the contents list and a DocContainer of
+    # sections, tables spread over the sections, then schedules with images
+    rng = random.Random(seed)
+    contents = ''.join(f'<p class="LegP1Container">{n} {escape(sentence(rng, 4))}</p>' for n in range(1, sections + 1))
+    body = []
+    for n in range(1, sections + 1):
+        body.append(f'<h2 id="section-{n}" class="LegP1GroupTitleFirst">{n} Section heading</h2>')
+        body.append(f'<div><p class="LegP1GroupTitle">{escape(sentence(rng, 4))}</p></div>')
+        body += [f'<p class="LegText">{escape(sentence(rng, 30))}</p>' for _ in range(3)]
+        if tables and n % max(1, sections // tables) == 0 and n // max(1, sections // tables) <= tables:
+            body.append(_table(rng, f'tbl-{n}', table_rows, table_cols))
+    for s in range(1, schedules + 1):
+        body.append(f'<div class="LegSchedule"><p>SCHEDULE {s} {escape(sentence(rng, 3))}</p></div>')
+        body += [f'<p class="LegText">{escape(sentence(rng, 30))}</p>' for _ in range(5)]
+    body += [f'<div><img class="LegDisplayImage" src="images/img{i}.png"/></div>' for i in range(images)]
+    chrome = '<div id="nav"><ul>' + ''.join(f'<li><a href="/browse/{i}">Link {i}</a></li>' for i in range(200)) + \
+             '</ul></div>'
+    return (f'<html><head><title>Synthetic Act 2024</title><script>var tracking = {{}};</script></head><body>'
+            f'{chrome}<div class="LegSnippet"><div class="LegPrelims"><h1 class="LegTitle">Synthetic Act 2024</h1>'
+            f'<p class="LegNo">2024 c. 1</p><p class="LegLongTitle">{escape(sentence(rng, 15))}</p>'
+            f'<p class="LegDateOfEnactment">[1st January 2024]</p></div><div class="LegContents">{contents}</div>'
+            f'<div class="DocContainer">{"".join(body)}</div></div><div id="footer">Footer</div></body></html>\n')
+
+
+def write_corpus(folder, judgments=6, acts=6, seed=0):
+    # A small mixed input tree of judgments and Acts in nested folders, plus a PDF that is copied as an asset
+    paths = []
+    for number in range(judgments + acts):
+        folder_path = os.path.join(folder, f'batch{number % 3}')
+        os.makedirs(folder_path, exist_ok=True)
+        if number < judgments:
+            path = os.path.join(folder_path, f'judgment{number}.xml')
+            text = generate_judgment(paragraphs=5 + number, seed=seed + number)
+        else:
+            path = os.path.join(folder_path, f'act{number}.html')
+            text = generate_legislation(sections=5 + number, tables=2, seed=seed + number)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        paths.append(path)
+    path = os.path.join(folder, 'batch0', 'attachment.pdf')
+    with open(path, 'wb') as file:
+        file.write(b'%PDF-1.4\n' + bytes(random.Random(seed).randrange(256) for _ in range(512)))
+    paths.append(path)
+    return paths
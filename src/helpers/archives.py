@@ -0,0 +1,266 @@
+import io
+import json
+import locale
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+
+ZIP_SUFFIXES = ('.zip',)
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')
+JSONL_SUFFIXES = ('.jsonl',)
+INDEX_SUFFIX = '.index.jsonl'
+TAR_WRITE_MODES = {'.tar': 'w', '.tar.gz': 'w:gz', '.tgz': 'w:gz', '.tar.bz2': 'w:bz2', '.tar.xz': 'w:xz'}
+
+
+def _suffix(path, suffixes):
+    lowered = path.lower()
+    return next((suffix for suffix in suffixes if lowered.endswith(suffix)), None)
+
+
+def is_archive(path):
+    return os.path.isfile(path) and _suffix(path, ZIP_SUFFIXES + TAR_SUFFIXES) is not None
+
+
+def is_sink_path(path):
+    # Outputs named like an archive or a JSON Lines file are written as shards instead of a mirrored tree
+    return _suffix(path, ZIP_SUFFIXES + TAR_SUFFIXES + JSONL_SUFFIXES) is not None
+
+
+def member_name(name):
+    # Archive member names are relative posix paths, refuse the ones that would escape the output root
+    name = posixpath.normpath(name.replace('\\', '/')).lstrip('/')
+    if name == '..' or name.startswith('../'):
+        raise ValueError(f'Unsafe archive member name {name!r}')
+    return name
+
+
+def iter_tree(folder):
+    for current, dirs, files in os.walk(folder, followlinks=True):
+        dirs.sort()
+        for item in sorted(files):
+            path = os.path.join(current, item)
+            with open(path, 'rb') as file:
+                yield os.path.relpath(path, folder).replace(os.sep, '/'), file.read()
+
+
+def iter_archive(path):
+    # Yields (name, data) for the regular files of an archive in archive order, tar archives are read as a
+    # stream so compressed dumps are decompressed once and never unpacked to disk
+    if _suffix(path, ZIP_SUFFIXES):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield member_name(info.filename), archive.read(info)
+        return
+    with tarfile.open(path, 'r|*') as archive:
+        for member in archive:
+            if member.isfile():
+                yield member_name(member.name), archive.extractfile(member).read()
+
+
+def iter_inputs(path):
+    return iter_archive(path) if is_archive(path) else iter_tree(path)
+
+
+def input_totals(path):
+    # File count and bytes for the progress ETA, tar streams cannot be sized without reading them so they report 0
+    if not is_archive(path):
+        sizes = [os.path.getsize(os.path.join(current, item))
+                 for current, _, files in os.walk(path, followlinks=True) for item in files]
+        return len(sizes), sum(sizes)
+    if _suffix(path, ZIP_SUFFIXES):
+        with zipfile.ZipFile(path) as archive:
+            infos = [info for info in archive.infolist() if not info.is_dir()]
+        return len(infos), sum(info.file_size for info in infos)
+    return 0, 0
+
+
+def _encode(data, encoding):
+    if isinstance(data, bytes):
+        return data
+    return data.encode(encoding or locale.getpreferredencoding(False))
+
+
+class TreeSink:
+    # Mirrors the input layout below a folder, the same layout run_files produces
+    accepts_assets = True
+    records = False
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def write(self, name, data, encoding=None):
+        path = os.path.join(self.folder, *member_name(name).split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(data, bytes):
+            with open(path, 'wb') as file:
+                file.write(data)
+        else:
+            with open(path, 'w', encoding=encoding) as file:
+                file.write(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ShardSink(TreeSink):
+    # Writes members into numbered shards next to `path` (out.zip -> out-00000.zip, out-00001.zip, ...),
+    # starting a new shard once one holds shard_files members or shard_bytes uncompressed bytes, or into
+    # `path` alone when neither limit is set
+    suffixes = ()
+
+    def __init__(self, path, shard_files=None, shard_bytes=None):
+        super().__init__(os.path.dirname(path))
+        self.suffix = _suffix(path, self.suffixes)
+        self.stem = path[:len(path) - len(self.suffix)]
+        self.shard_files = shard_files
+        self.shard_bytes = shard_bytes
+        self.shard_index = 0
+        self.shard_count = 0
+        self.shard_size = 0
+        self.shard_paths = []
+        self.current = None
+
+    def shard_path(self, index):
+        if self.shard_files or self.shard_bytes:
+            return f'{self.stem}-{index:05d}{self.suffix}'
+        return self.stem + self.suffix
+
+    def write(self, name, data, encoding=None):
+        data = _encode(data, encoding)
+        self._reserve(len(data))
+        self._add(member_name(name), data)
+
+    def _reserve(self, size):
+        # Rolls over to the next shard if this member would overflow the current one, a member larger than
+        # shard_bytes still gets a shard of its own
+        full = self.shard_count and (
+            (self.shard_files and self.shard_count >= self.shard_files)
+            or (self.shard_bytes and self.shard_size + size > self.shard_bytes))
+        if self.current is None or full:
+            self._roll()
+        self.shard_count += 1
+        self.shard_size += size
+
+    def _roll(self):
+        if self.current is not None:
+            self._close_shard()
+            self.shard_index += 1
+        path = self.shard_path(self.shard_index)
+        if self.folder:
+            os.makedirs(self.folder, exist_ok=True)
+        self.current = self._open_shard(path)
+        self.shard_paths.append(path)
+        self.shard_count = 0
+        self.shard_size = 0
+
+    def close(self):
+        if self.current is not None:
+            self._close_shard()
+            self.current = None
+
+    def _open_shard(self, path):
+        raise NotImplementedError
+
+    def _add(self, name, data):
+        raise NotImplementedError
+
+    def _close_shard(self):
+        self.current.close()
+
+
+class ZipSink(ShardSink):
+    suffixes = ZIP_SUFFIXES
+
+    def _open_shard(self, path):
+        return zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _add(self, name, data):
+        self.current.writestr(name, data)
+
+
+class TarSink(ShardSink):
+    suffixes = TAR_SUFFIXES
+
+    def _open_shard(self, path):
+        return tarfile.open(path, TAR_WRITE_MODES[self.suffix])
+
+    def _add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.current.addfile(info, io.BytesIO(data))
+
+
+class JsonlSink(ShardSink):
+    # Appends the convert_record line of each document to rolling .jsonl shards and writes an index line
+    # {"id", "sourcePath", "shard", "offset", "length"} per record to <stem>.index.jsonl, so one record can be
+    # read back with a seek instead of a scan. Assets have no place in a JSON Lines shard.
+    suffixes = JSONL_SUFFIXES
+    accepts_assets = False
+    records = True
+
+    def __init__(self, path, shard_files=None, shard_bytes=None):
+        super().__init__(path, shard_files, shard_bytes)
+        self.index_path = self.stem + INDEX_SUFFIX
+        self.index = None
+
+    def write(self, name, data, encoding=None):
+        raise TypeError('JSON Lines shards take records, use write_record')
+
+    def write_record(self, source_name, key, line):
+        data = line.encode('utf-8') + b'\n'
+        self._reserve(len(data))
+        if self.index is None:
+            self.index = open(self.index_path, 'w', encoding='utf-8')
+        offset = self.current.tell()
+        self.current.write(data)
+        entry = {'id': key, 'sourcePath': source_name, 'shard': os.path.basename(self.shard_paths[-1]),
+                 'offset': offset, 'length': len(data)}
+        self.index.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def _open_shard(self, path):
+        return open(path, 'wb')
+
+    def close(self):
+        super().close()
+        if self.index is not None:
+            self.index.close()
+            self.index = None
+
+
+def load_index(index_path):
+    # Maps every record id of a JSON Lines batch to its (shard path, offset, length), the first record wins
+    # when several statutes share an id
+    folder = os.path.dirname(index_path)
+    entries = {}
+    with open(index_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            entry = json.loads(line)
+            entries.setdefault(entry['id'], (os.path.join(folder, entry['shard']), entry['offset'], entry['length']))
+    return entries
+
+
+def read_record(entry):
+    shard_path, offset, length = entry
+    with open(shard_path, 'rb') as file:
+        file.seek(offset)
+        return json.loads(file.read(length))
+
+
+def open_sink(path, shard_files=None, shard_bytes=None):
+    if _suffix(path, ZIP_SUFFIXES):
+        return ZipSink(path, shard_files, shard_bytes)
+    if _suffix(path, TAR_SUFFIXES):
+        return TarSink(path, shard_files, shard_bytes)
+    if _suffix(path, JSONL_SUFFIXES):
+        return JsonlSink(path, shard_files, shard_bytes)
+    return TreeSink(path)
@@ -0,0 +1,123 @@
+import errno
+import fnmatch
+import os
+import posixpath
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, reflinks then fall back to copying
+    fcntl = None
+
+COPY = 'copy'
+HARDLINK = 'hardlink'
+REFLINK = 'reflink'
+SYMLINK = 'symlink'
+STRATEGIES = (COPY, HARDLINK, REFLINK, SYMLINK)
+
+# _IOW(0x94, 9, int) from linux/fs.h, clones the extents of one file into another on Btrfs, XFS and similar
+FICLONE = 0x40049409
+# Errors meaning this filesystem or pair of filesystems cannot link or clone, so copying is the answer
+UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS, errno.EMLINK}
+
+
+class AssetCopier:
+    # Mirrors the files that are not converted into the output tree with the cheapest strategy available.
+    # A strategy the filesystem refuses is dropped for the rest of the run and the asset copied instead.
+    def __init__(self, strategy=COPY, skip_identical=False, exclude=()):
+        self.strategy = strategy
+        self.skip_identical = skip_identical
+        self.exclude = tuple(exclude)
+        self.unsupported = set()
+        # action -> [files, input bytes], bytes_copied counts only the bytes really written
+        self.actions = {}
+        self.bytes_copied = 0
+
+    def excluded(self, relative, size=None):
+        # Patterns match the relative posix path or the file name, e.g. '*.pdf' or 'images/*'. Counted as an
+        # excluded asset when the size is given.
+        name = posixpath.basename(relative)
+        if not any(fnmatch.fnmatchcase(relative, pattern) or fnmatch.fnmatchcase(name, pattern)
+                   for pattern in self.exclude):
+            return False
+        if size is not None:
+            counts = self.actions.setdefault('excluded', [0, 0])
+            counts[0] += 1
+            counts[1] += size
+        return True
+
+    def mirror(self, input_path, output_path, stat=None):
+        # Returns the action taken and the number of bytes written
+        stat = stat or os.stat(input_path)
+        if self.skip_identical and self._identical(input_path, output_path, stat):
+            action, written = 'unchanged', 0
+        else:
+            action, written = self._mirror(input_path, output_path, stat)
+        counts = self.actions.setdefault(action, [0, 0])
+        counts[0] += 1
+        counts[1] += stat.st_size
+        self.bytes_copied += written
+        return action, written
+
+    def _identical(self, input_path, output_path, stat):
+        try:
+            target = os.stat(output_path) if self.strategy != SYMLINK else None
+        except FileNotFoundError:
+            return False
+        if target is None:
+            return os.path.islink(output_path) and os.readlink(output_path) == os.path.abspath(input_path)
+        return (target.st_size == stat.st_size and target.st_mtime_ns == stat.st_mtime_ns) or (
+            target.st_ino == stat.st_ino and target.st_dev == stat.st_dev)
+
+    def _mirror(self, input_path, output_path, stat):
+        # Links cannot be overwritten, and writing through one left by an earlier run would overwrite the input
+        if os.path.lexists(output_path) and (self.strategy in (HARDLINK, SYMLINK) or os.path.islink(output_path)
+                                             or os.path.samefile(input_path, output_path)):
+            os.remove(output_path)
+        strategy = self.strategy if self.strategy not in self.unsupported else COPY
+        if strategy == HARDLINK:
+            if self._attempt(strategy, lambda: os.link(input_path, output_path)):
+                return 'hardlinked', 0
+        elif strategy == SYMLINK:
+            if self._attempt(strategy, lambda: os.symlink(os.path.abspath(input_path), output_path)):
+                return 'symlinked', 0
+        elif strategy == REFLINK:
+            if fcntl is not None and self._attempt(strategy, lambda: _clone(input_path, output_path)):
+                return 'reflinked', 0
+            if hasattr(os, 'copy_file_range') and 'copy_file_range' not in self.unsupported:
+                if self._attempt('copy_file_range', lambda: _copy_range(input_path, output_path, stat.st_size)):
+                    return 'copied', stat.st_size
+        shutil.copy2(input_path, output_path)
+        return 'copied', stat.st_size
+
+    def _attempt(self, strategy, operation):
+        try:
+            operation()
+            return True
+        except OSError as error:
+            if error.errno not in UNSUPPORTED:
+                raise
+            self.unsupported.add(strategy)
+            return False
+
+    def report(self):
+        parts = [f'{files} {action} ({size} bytes)' for action, (files, size) in sorted(self.actions.items())]
+        return f'Assets: {", ".join(parts) or "none"}; {self.bytes_copied} bytes copied'
+
+
+def _clone(input_path, output_path):
+    with open(input_path, 'rb') as source, open(output_path, 'wb') as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    shutil.copystat(input_path, output_path)
+
+
+def _copy_range(input_path, output_path, size):
+    # Copies inside the kernel, which filesystems and NFS servers may turn into a server side copy or a clone
+    with open(input_path, 'rb') as source, open(output_path, 'wb') as target:
+        offset = 0
+        while offset < size:
+            copied = os.copy_file_range(source.fileno(), target.fileno(), size - offset)
+            if not copied:
+                break
+            offset += copied
+    shutil.copystat(input_path, output_path)
@@ -0,0 +1,53 @@
+from src.helpers.manifest import file_digest
+
+
+class Deduplicator:
+    # Groups byte-identical inputs of the same type so each is converted once and its output reused for the
+    # copies. Only inputs whose size collides with another of their type are hashed, a tree without duplicates
+    # costs no extra reads.
+    def __init__(self, registry, sizes, digest_of=file_digest):
+        self.registry = registry
+        self.sizes = sizes
+        self.digest_of = digest_of
+        # primary input path -> the (input, output) jobs with the same content
+        self.duplicates = {}
+        self.hashed_files = 0
+        self.total_files = 0
+
+    def split(self, jobs):
+        # Returns the jobs to convert, in the order given, and records the duplicates of each
+        self.total_files += len(jobs)
+        candidates = {}
+        for job in jobs:
+            candidates.setdefault((self.registry.match(job[0]), self.sizes[job[0]]), []).append(job)
+        primaries = set()
+        for group in candidates.values():
+            if len(group) == 1:
+                primaries.add(group[0][0])
+                continue
+            by_digest = {}
+            for job in group:
+                by_digest.setdefault(self.digest_of(job[0]), []).append(job)
+            self.hashed_files += len(group)
+            for same in by_digest.values():
+                primaries.add(same[0][0])
+                if len(same) > 1:
+                    self.duplicates[same[0][0]] = same[1:]
+        return [job for job in jobs if job[0] in primaries]
+
+    def copies_of(self, input_path):
+        return self.duplicates.get(input_path, ())
+
+    @property
+    def duplicate_files(self):
+        return sum(len(jobs) for jobs in self.duplicates.values())
+
+    @property
+    def duplicate_bytes(self):
+        return sum(self.sizes[job[0]] for jobs in self.duplicates.values() for job in jobs)
+
+    def report(self):
+        ratio = self.duplicate_files / self.total_files if self.total_files else 0.0
+        return (f'Deduplicated {self.duplicate_files} of {self.total_files} inputs ({ratio:.1%}) in '
+                f'{len(self.duplicates)} groups, {self.duplicate_bytes} bytes not converted again; '
+                f'hashed {self.hashed_files} inputs with colliding sizes')
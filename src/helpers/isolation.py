@@ -0,0 +1,191 @@
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # not available on Windows, memory budgets are then not enforced
+    resource = None
+
+QUARANTINE_NAME = '.quarantine.json'
+# Sent by a worker once its initializer ran, jobs are only timed from then on
+READY = 'ready'
+
+
+def _address_space():
+    # Current virtual size of this process, the baseline the per-file memory budget is added to
+    try:
+        with open('/proc/self/statm') as file:
+            return int(file.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def _out_of_memory(error):
+    # Whether a job's traceback ends in a MemoryError, after which the worker's heap is not trusted again
+    lines = error.strip().splitlines() if error else []
+    return bool(lines) and lines[-1].startswith('MemoryError')
+
+
+def _worker_main(connection, initializer, initargs, fn, memory_limit):
+    # Runs jobs until told to stop. The initializer loads the processors first, so the budget is measured from
+    # a warm worker. A worker that ran out of memory exits after reporting it, a half unwound MemoryError never
+    # reaches the next file; ordinary failures keep the worker.
+    initializer(*initargs)
+    if memory_limit and resource is not None:
+        limit = _address_space() + memory_limit
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    connection.send(READY)
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            return
+        if job is None:
+            return
+        result = fn(job)
+        connection.send(result)
+        if _out_of_memory(result[1]):
+            return
+
+
+class _Worker:
+    def __init__(self, context, initializer, initargs, fn, memory_limit):
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child, initializer, initargs, fn, memory_limit),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.ready = False
+        self.job = None
+        self.started = None
+
+    def assign(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.connection.send(job)
+
+    def stop(self, kill=False):
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.connection.send(None)
+            except OSError:
+                pass
+        self.process.join()
+        self.connection.close()
+
+
+class IsolatedExecutor:
+    # Runs every file in a worker process of its own pool with a wall-clock timeout and an address space budget,
+    # replacing a worker that times out, crashes or runs out of memory instead of letting it stall or poison the
+    # batch. fn(job) must return (job, error, spans, elapsed) like the runner's jobs do.
+    def __init__(self, workers, initializer, initargs, fn, timeout=None, memory_limit=None):
+        self.workers = workers
+        self.initializer = initializer
+        self.initargs = initargs
+        self.fn = fn
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.context = multiprocessing.get_context()
+
+    def _start(self):
+        return _Worker(self.context, self.initializer, self.initargs, self.fn, self.memory_limit)
+
+    def map(self, jobs):
+        jobs = iter(jobs)
+        exhausted = False
+        workers = [self._start() for _ in range(self.workers)]
+        try:
+            while True:
+                for worker in workers:
+                    if worker.ready and worker.job is None and not exhausted:
+                        job = next(jobs, None)
+                        if job is None:
+                            exhausted = True
+                        else:
+                            worker.assign(job)
+                busy = [worker for worker in workers if worker.job is not None]
+                starting = [worker for worker in workers if not worker.ready]
+                if not busy and (exhausted or not starting):
+                    return
+                wait_for = None
+                if self.timeout and busy:
+                    wait_for = max(0.0, min(worker.started for worker in busy) + self.timeout - time.monotonic())
+                wait([worker.connection for worker in busy + starting]
+                     + [worker.process.sentinel for worker in busy + starting], wait_for)
+                for worker in starting:
+                    self._start_up(worker)
+                for worker in busy:
+                    result, replace = self._collect(worker)
+                    if result is not None:
+                        yield result
+                    if replace:
+                        workers[workers.index(worker)] = self._start()
+        finally:
+            for worker in workers:
+                worker.stop(kill=worker.job is not None or not worker.ready)
+
+    def _start_up(self, worker):
+        if worker.connection.poll():
+            worker.ready = worker.connection.recv() == READY
+        elif not worker.process.is_alive():
+            # Failing before the first job would fail every replacement too
+            raise RuntimeError(f'Worker exited with code {worker.process.exitcode} while starting')
+
+    def _collect(self, worker):
+        # Returns the result the worker produced, if any, and whether the worker has to be replaced
+        elapsed = time.monotonic() - worker.started
+        if worker.connection.poll():
+            try:
+                result = worker.connection.recv()
+            except EOFError:
+                result = None
+            if result is not None:
+                worker.job = None
+                if _out_of_memory(result[1]):
+                    worker.stop()
+                    return result, True
+                return result, False
+        job = worker.job
+        if not worker.process.is_alive():
+            worker.job = None
+            worker.stop()
+            error = f'Worker exited with code {worker.process.exitcode} while processing {job[0]}\n'
+            return (job, error, None, elapsed), True
+        if self.timeout and elapsed >= self.timeout:
+            worker.job = None
+            worker.stop(kill=True)
+            return (job, f'Timed out after {elapsed:.1f}s processing {job[0]}\n', None, elapsed), True
+        return None, False
+
+
+class Quarantine:
+    # Files that failed, with the traceback and how long they ran, written as JSON for --retry-failures
+    def __init__(self):
+        self.entries = []
+
+    def add(self, input_path, output_path, error, elapsed):
+        self.entries.append({
+            'input': input_path,
+            'output': output_path,
+            'error': error.strip().splitlines()[-1] if error.strip() else '',
+            'traceback': error,
+            'elapsed_seconds': elapsed,
+            'time': time.time(),
+        })
+
+    def write(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'files': self.entries}, file, indent=1)
+        os.replace(tmp_path, path)
+
+
+def load_quarantine(path):
+    # Absolute input paths of the files a previous run quarantined
+    with open(path, 'r', encoding='utf-8') as file:
+        return {os.path.abspath(entry['input']) for entry in json.load(file)['files']}
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = '.manifest.json'
+MANIFEST_FORMAT = 1
+COPY_PROCESSOR = 'copy'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_name(input_types=(), shard=None):
+    # Runs over different input types or shards that share an output folder keep separate manifests, so none of
+    # them records the others' documents as copied assets or prunes their outputs
+    parts = [input_type.lstrip('.') for input_type in input_types]
+    if shard is not None:
+        parts.append(f'{shard[0]}of{shard[1]}')
+    return f'.manifest-{"-".join(parts)}.json' if parts else MANIFEST_NAME
+
+
+def processor_version(process_object):
+    # The declared fingerprint plus a digest of the processor's output sources (its module, the templates,
+    # records and backends it renders with, an alternate template file), so editing any of them invalidates
+    # earlier outputs even if nobody bumps the version
+    digest = hashlib.sha256()
+    for source in process_object.output_sources():
+        if source and os.path.exists(source):
+            digest.update(file_digest(source).encode('ascii'))
+    return f'{process_object.fingerprint()}:{digest.hexdigest()[:12]}'
+
+
+class Manifest:
+    def __init__(self, output_folder, name=MANIFEST_NAME):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, name)
+        self.entries = {}
+        self.seen = set()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('format') == MANIFEST_FORMAT:
+                self.entries = data.get('files', {})
+        return self
+
+    def save(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({'format': MANIFEST_FORMAT, 'files': self.entries}, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def digest(self, key, input_path):
+        # Reuse the recorded hash while size and mtime are unchanged, like git's index does
+        self.seen.add(key)
+        stat = os.stat(input_path)
+        entry = self.entries.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry['hash'], stat
+        return file_digest(input_path), stat
+
+    def is_current(self, key, digest, processor, output_path):
+        entry = self.entries.get(key)
+        return (entry is not None and entry['hash'] == digest and entry['processor'] == processor
+                and entry['output'] == self._relative(output_path) and os.path.exists(output_path))
+
+    def record(self, key, digest, stat, processor, output_path):
+        self.entries[key] = {
+            'hash': digest,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'processor': processor,
+            'output': self._relative(output_path),
+        }
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def prune(self):
+        # Remove outputs whose source disappeared from the input tree since the last run
+        pruned = 0
+        for key in [key for key in self.entries if key not in self.seen]:
+            output_path = os.path.join(self.output_folder, self.entries.pop(key)['output'])
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                pruned += 1
+                self._remove_empty_parents(os.path.dirname(output_path))
+        return pruned
+
+    def _remove_empty_parents(self, directory):
+        root = os.path.abspath(self.output_folder)
+        directory = os.path.abspath(directory)
+        while directory != root and directory.startswith(root) and not os.listdir(directory):
+            os.rmdir(directory)
+            directory = os.path.dirname(directory)
+
+    def _relative(self, output_path):
+        return os.path.relpath(output_path, self.output_folder)
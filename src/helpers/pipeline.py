@@ -0,0 +1,164 @@
+import queue
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.helpers import profiling
+
+# Processor registry of the current pool worker, whether it profiles and whether it converts to JSON Lines
+# records, set once by the pool initializer. Every executor of the runner shares these workers.
+_worker_registry = None
+_worker_profile = False
+_worker_records = False
+_DONE = object()
+
+
+def init_worker(registry, profile=False, records=False, warm=False):
+    # warm loads every processor up front, for isolated workers that must not charge it to their first file
+    global _worker_registry, _worker_profile, _worker_records
+    _worker_registry = registry
+    _worker_profile = profile
+    _worker_records = records
+    if warm:
+        registry.warm()
+
+
+def bounded_map(executor, fn, items, limit):
+    # Keep at most `limit` jobs in flight so huge trees do not queue every future up front
+    pending = set()
+    for item in items:
+        if len(pending) >= limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(fn, item))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def _read(input_path):
+    with open(input_path, 'rb') as file:
+        return file.read()
+
+
+def _timed(input_path, work):
+    # Runs work() for one input in a worker, returns its result, the traceback if it failed, when profiling the
+    # spans it recorded, and the seconds it took
+    collector = profiling.enable() if _worker_profile else None
+    started = time.perf_counter()
+    try:
+        result, error = work(), None
+    except Exception:
+        result, error = None, traceback.format_exc()
+    elapsed = time.perf_counter() - started
+    if collector is None:
+        return result, error, None, elapsed
+    profiling.disable()
+    collector.add_file(input_path, elapsed)
+    return result, error, collector.snapshot(), elapsed
+
+
+def process_job(job):
+    # Converts the input file of an (input, output) job into its output file, returns the job, the traceback if
+    # it failed, the spans and the seconds it took
+    def work():
+        _worker_registry.for_path(job[0]).process_file(job[0], job[1])
+
+    _, error, spans, elapsed = _timed(job[0], work)
+    return job, error, spans, elapsed
+
+
+def _convert(item):
+    # CPU stage: returns the job, the traceback if it failed, the converted text, or the (key, line) record,
+    # the recorded spans and the seconds the conversion took
+    job, content = item
+
+    def work():
+        process_object = _worker_registry.for_path(job[0])
+        convert = process_object.convert_record if _worker_records else process_object.convert
+        return convert(content, job[0])
+
+    text, error, spans, elapsed = _timed(job[0], work)
+    return job, error, text, spans, elapsed
+
+
+def _prefetch(read_pool, jobs, depth, results):
+    # Keeps up to `depth` reads in flight ahead of the CPU stage, read failures go straight to the results
+    window = deque()
+
+    def resolve(job, future):
+        try:
+            return job, future.result()
+        except Exception:
+            results.put((job, traceback.format_exc(), None, None))
+            return None
+
+    for job in jobs:
+        window.append((job, read_pool.submit(_read, job[0])))
+        if len(window) >= depth:
+            item = resolve(*window.popleft())
+            if item is not None:
+                yield item
+    while window:
+        item = resolve(*window.popleft())
+        if item is not None:
+            yield item
+
+
+def execute(registry, fn, items, workers, depth, profile=False, records=False):
+    # Maps fn over items on this process or a pool of initialized workers, yielding the results as they finish
+    if workers == 1:
+        init_worker(registry, profile, records)
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(registry, profile, records)) as executor:
+        yield from bounded_map(executor, fn, items, depth)
+
+
+def convert_all(registry, items, workers, depth, profile, records=False):
+    # Converts (job, content) items, yielding (job, error, text, spans, elapsed) as they finish
+    return execute(registry, _convert, items, workers, depth, profile, records)
+
+
+def _write_loop(writes, results):
+    while True:
+        item = writes.get()
+        if item is _DONE:
+            return
+        job, text, encoding, spans, elapsed = item
+        try:
+            with open(job[1], 'w', encoding=encoding) as file:
+                file.write(text)
+            results.put((job, None, spans, elapsed))
+        except Exception:
+            results.put((job, traceback.format_exc(), spans, elapsed))
+
+
+def run_pipeline(registry, jobs, workers=1, io_threads=4, depth=16, profile=False):
+    # Reads on an I/O thread pool, converts on the main thread or a process pool and writes on a background
+    # thread, with bounded queues between the stages. Yields (job, error, spans, elapsed) as files complete,
+    # elapsed being the conversion time.
+    results = queue.Queue()
+    writes = queue.Queue(maxsize=depth)
+    writer = threading.Thread(target=_write_loop, args=(writes, results), name='pipeline-writer', daemon=True)
+    writer.start()
+    try:
+        with ThreadPoolExecutor(max_workers=io_threads, thread_name_prefix='pipeline-reader') as read_pool:
+            items = _prefetch(read_pool, jobs, depth, results)
+            for job, error, text, spans, elapsed in convert_all(registry, items, workers, depth, profile):
+                if error:
+                    results.put((job, error, spans, elapsed))
+                else:
+                    writes.put((job, text, registry.output_encoding(registry.match(job[0])), spans, elapsed))
+                while not results.empty():
+                    yield results.get()
+    finally:
+        writes.put(_DONE)
+        writer.join()
+    while not results.empty():
+        yield results.get()
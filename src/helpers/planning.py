@@ -0,0 +1,100 @@
+import os
+import traceback
+
+from src.helpers.sharding import in_shard, relative_key
+
+
+def _file_type(path):
+    return os.path.splitext(path)[1].lower() or '(none)'
+
+
+class Plan:
+    # Output directories to create, (input, output) pairs to process and to copy, and the size of every input.
+    # errors maps the inputs that could not be stat'ed, e.g. dangling symlinks, to the traceback the runner
+    # reports them as failed with.
+    def __init__(self):
+        self.directories = []
+        self.jobs = []
+        self.assets = []
+        self.sizes = {}
+        self.errors = {}
+
+    @property
+    def total_files(self):
+        return len(self.jobs) + len(self.assets)
+
+    @property
+    def total_bytes(self):
+        return sum(self.sizes[input_path] for input_path, _ in self.jobs + self.assets)
+
+    def select_shard(self, input_folder, shard):
+        if shard is not None:
+            self.jobs = [job for job in self.jobs if in_shard(relative_key(job[0], input_folder), shard)]
+            self.assets = [asset for asset in self.assets if in_shard(relative_key(asset[0], input_folder), shard)]
+        return self
+
+    def largest_first(self):
+        # Start the big files first so a huge judgment is not the lone tail of a parallel run, the sort is
+        # stable so equal sizes keep the walk order
+        self.jobs.sort(key=lambda job: self.sizes[job[0]], reverse=True)
+        return self
+
+    def type_totals(self):
+        # (action, file type) -> [files, bytes]
+        totals = {}
+        for action, items in (('process', self.jobs), ('copy', self.assets)):
+            for input_path, _ in items:
+                counts = totals.setdefault((action, _file_type(input_path)), [0, 0])
+                counts[0] += 1
+                counts[1] += self.sizes[input_path]
+        return totals
+
+    def report(self, largest=10):
+        print(f'Planned {self.total_files} files, {self.total_bytes:,} bytes: {len(self.jobs)} to process, '
+              f'{len(self.assets)} to copy')
+        for input_path in self.errors:
+            print(f'  unreadable {input_path}')
+        for (action, file_type), (files, size) in sorted(self.type_totals().items()):
+            print(f'  {action:<8} {file_type:<10} {files:>9,} files {size:>17,} bytes')
+        if self.jobs and largest:
+            print(f'Largest {min(largest, len(self.jobs))} files to process:')
+            for input_path, _ in self.jobs[:largest]:
+                print(f'  {self.sizes[input_path]:>15,} bytes  {input_path}')
+
+
+def scan_tree(input_folder, output_folder, registry):
+    # Walks the input tree once with os.scandir, taking the file type and size from the directory entries
+    # instead of a separate isdir and getsize call per file. registry.match picks the files to process.
+    plan = Plan()
+    pending = [(input_folder, output_folder)]
+    while pending:
+        current, output_dir = pending.pop()
+        plan.directories.append(output_dir)
+        with os.scandir(current) as scanner:
+            entries = sorted(scanner, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir():
+                subdirectories.append((entry.path, os.path.join(output_dir, entry.name)))
+                continue
+            try:
+                plan.sizes[entry.path] = entry.stat().st_size
+            except OSError:
+                # A dangling symlink or a file deleted since the scandir fails on its own, not the whole run
+                plan.sizes[entry.path] = 0
+                plan.errors[entry.path] = traceback.format_exc()
+            output_path = os.path.join(output_dir, entry.name)
+            input_type = registry.match(entry.name)
+            if input_type is not None:
+                plan.jobs.append((entry.path, registry.output_name(output_path, input_type)))
+            else:
+                plan.assets.append((entry.path, output_path))
+        # Reversed onto the stack so directories are visited in name order, parents before children
+        pending.extend(reversed(subdirectories))
+    return plan
+
+
+def plan_files(input_folder, output_folder, registry):
+    # Walk the input tree once and split it into files to process and assets to copy
+    plan = scan_tree(input_folder, output_folder, registry)
+    return plan.directories, plan.jobs, plan.assets
@@ -0,0 +1,111 @@
+import json
+import time
+
+# The active collector, None keeps every span a shared no-op object
+_collector = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('collector', 'name', 'started')
+
+    def __init__(self, collector, name):
+        self.collector = collector
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.collector.add(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name):
+    # Times the enclosed block under `name` while a collector is enabled
+    collector = _collector
+    if collector is None:
+        return _NULL_SPAN
+    return _Span(collector, name)
+
+
+def enable(collector=None):
+    global _collector
+    _collector = collector if collector is not None else Collector()
+    return _collector
+
+
+def disable():
+    global _collector
+    collector, _collector = _collector, None
+    return collector
+
+
+def get_collector():
+    return _collector
+
+
+class Collector:
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        # stage name -> [count, total seconds, max seconds]
+        self.stages = {}
+        # (seconds, path) of every file, trimmed to the slowest ones on report
+        self.files = []
+
+    def add(self, name, seconds):
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = [1, seconds, seconds]
+        else:
+            stage[0] += 1
+            stage[1] += seconds
+            if seconds > stage[2]:
+                stage[2] = seconds
+
+    def add_file(self, path, seconds):
+        self.files.append((seconds, path))
+
+    def snapshot(self):
+        return {'stages': self.stages, 'files': self.files}
+
+    def merge(self, snapshot):
+        for name, (count, total, longest) in snapshot['stages'].items():
+            stage = self.stages.setdefault(name, [0, 0.0, 0.0])
+            stage[0] += count
+            stage[1] += total
+            stage[2] = max(stage[2], longest)
+        self.files.extend(snapshot['files'])
+
+    def slowest_files(self):
+        return sorted(self.files, reverse=True)[:self.slowest]
+
+    def report(self):
+        lines = [f'{"stage":<28} {"count":>8} {"total s":>10} {"mean ms":>10} {"max ms":>10}']
+        for name, (count, total, longest) in sorted(self.stages.items(), key=lambda item: -item[1][1]):
+            lines.append(f'{name:<28} {count:>8} {total:>10.3f} {total / count * 1000:>10.3f} {longest * 1000:>10.3f}')
+        if self.files:
+            lines.append(f'Slowest {min(self.slowest, len(self.files))} files:')
+            lines += [f'{seconds * 1000:>10.1f} ms  {path}' for seconds, path in self.slowest_files()]
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({
+                'stages': {name: {'count': count, 'total_s': total, 'max_s': longest}
+                           for name, (count, total, longest) in self.stages.items()},
+                'slowest_files': [{'path': path, 'seconds': seconds} for seconds, path in self.slowest_files()],
+            }, file, indent=2)
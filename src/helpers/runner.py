@@ -0,0 +1,297 @@
+import os
+import sys
+import time
+import traceback
+from stat import S_ISLNK
+
+from src.helpers.archives import input_totals, iter_inputs, open_sink
+from src.helpers.assets import AssetCopier
+from src.helpers.dedup import Deduplicator
+from src.helpers.isolation import IsolatedExecutor, Quarantine
+from src.helpers.manifest import COPY_PROCESSOR, Manifest, file_digest, manifest_name, processor_version
+from src.helpers.pipeline import convert_all, execute, init_worker, process_job, run_pipeline
+from src.helpers.planning import scan_tree
+from src.helpers.sharding import in_shard, relative_key
+from src.helpers.telemetry import RunTelemetry
+from src.service.registry import PROCESSORS, as_registry
+
+
+class RunSummary:
+    def __init__(self, telemetry=None):
+        self.telemetry = telemetry if telemetry is not None else RunTelemetry(progress_interval=0)
+        self.processed = 0
+        self.copied = 0
+        self.skipped = 0
+        self.skipped_bytes = 0
+        self.pruned = 0
+        self.failures = []
+        self.profile = None
+        self.assets = None
+        self.dedup = None
+        self.quarantine = Quarantine()
+        self.quarantine_path = None
+        self.queue = None
+        self.unfinished = []
+
+    def report(self):
+        total = self.processed + len(self.failures)
+        message = (f'Processed {self.processed} of {total} files, copied {self.copied} assets, '
+                   f'{len(self.failures)} failed')
+        if self.skipped or self.pruned:
+            message += (f'; skipped {self.skipped} unchanged inputs ({self.skipped_bytes} bytes), '
+                        f'pruned {self.pruned} stale outputs')
+        print(message)
+        if self.assets is not None and self.assets.actions:
+            print(self.assets.report())
+        if self.dedup is not None:
+            print(self.dedup.report())
+        if self.quarantine_path and self.quarantine.entries:
+            print(f'Quarantined {len(self.quarantine.entries)} files in {self.quarantine_path}')
+        if self.queue is not None and (self.queue.taken_over or self.unfinished):
+            print(f'Took over {self.queue.taken_over} stale claims; {len(self.unfinished)} claims unfinished')
+            now = time.time()
+            for claim in self.unfinished:
+                age = max(0.0, now - claim['time'])
+                print(f'  unfinished: {claim["key"]} claimed by {claim["owner"]} {age:.0f}s ago')
+        self.telemetry.report()
+        if self.profile is not None:
+            print(self.profile.report())
+
+
+def _claimed(items, input_folder, queue):
+    # Lazily claims items from the shared work queue, so each claim is taken just before the file is started
+    for item in items:
+        if queue.claim(relative_key(item[0], input_folder)):
+            yield item
+
+
+def _unlink_shared(jobs):
+    # Outputs that are links, e.g. to a deduplicated twin from an earlier run, are removed before they are
+    # rewritten so the processors never write through them into another output
+    for _, output_path in jobs:
+        try:
+            stat = os.lstat(output_path)
+        except FileNotFoundError:
+            continue
+        if S_ISLNK(stat.st_mode) or stat.st_nlink > 1:
+            os.remove(output_path)
+
+
+def _record_failure(summary, processor, item, error, elapsed, size=0):
+    summary.telemetry.processed(processor, size, failed=True)
+    summary.failures.append((item[0], error))
+    summary.quarantine.add(item[0], item[1], error, elapsed)
+    print(f'Failed to process {item[0]}:\n{error}', file=sys.stderr)
+
+
+def _filter_unchanged(manifest, input_folder, items, version_of, summary):
+    # Split items into the ones that need work and the manifest state to record once they succeed,
+    # version_of gives the processor version an input is converted with
+    pending = []
+    states = {}
+    for input_path, output_path in items:
+        key = os.path.relpath(input_path, input_folder).replace(os.sep, '/')
+        digest, stat = manifest.digest(key, input_path)
+        processor = version_of(input_path)
+        if manifest.is_current(key, digest, processor, output_path):
+            manifest.record(key, digest, stat, processor, output_path)
+            summary.skipped += 1
+            summary.skipped_bytes += stat.st_size
+            summary.telemetry.skipped(stat.st_size)
+        else:
+            pending.append((input_path, output_path))
+            states[input_path] = (key, digest, stat, processor)
+    return pending, states
+
+
+def run_files(process_object, input_folder, output_folder, input_type=None, out_type=None, workers=None,
+              incremental=False, profile=None, progress_interval=30.0, telemetry_path=None, prometheus_path=None,
+              pipeline=False, io_threads=4, prefetch=16, shard=None, queue=None, assets=None, dedup=None,
+              timeout=None, memory_limit=None, quarantine_path=None, only=None):
+    # process_object is a ProcessorRegistry, or one IProcess for the files ending in input_type.
+    # assets is the AssetCopier that mirrors the files which are not converted, plain copies by default.
+    # dedup is an AssetCopier too: when given, byte-identical inputs are converted once and it places the
+    # output at the destinations of the copies.
+    # profile is a profiling.Collector that aggregates the stage spans of every file, progress is printed to
+    # stderr every progress_interval seconds and the run telemetry written to the JSON and Prometheus paths.
+    # pipeline overlaps reading, converting and writing, with io_threads readers and prefetch files in flight.
+    # shard=(i, N) keeps only the files whose relative path hashes to shard i, queue is a sharding.WorkQueue
+    # that machines sharing the output claim files from instead.
+    # timeout (seconds) and memory_limit (bytes) run every file isolated in a worker process with that budget,
+    # failures are written to quarantine_path and only, a set of absolute input paths, retries just those.
+    registry = as_registry(process_object, input_type, out_type)
+    workers = workers or os.cpu_count() or 1
+    plan = scan_tree(input_folder, output_folder, registry).select_shard(input_folder, shard)
+    if only is not None:
+        plan.jobs = [job for job in plan.jobs if os.path.abspath(job[0]) in only]
+        plan.assets = [asset for asset in plan.assets if os.path.abspath(asset[0]) in only]
+    plan.largest_first()
+    copier = assets if assets is not None else AssetCopier()
+    plan.assets = [asset for asset in plan.assets
+                   if not copier.excluded(relative_key(asset[0], input_folder), plan.sizes[asset[0]])]
+    directories, sizes = plan.directories, plan.sizes
+    jobs = [job for job in plan.jobs if job[0] not in plan.errors]
+    assets = [asset for asset in plan.assets if asset[0] not in plan.errors]
+    summary = RunSummary(RunTelemetry(plan.total_files, plan.total_bytes, progress_interval))
+    summary.profile = profile
+    summary.assets = copier
+    summary.quarantine_path = quarantine_path
+    for item in plan.jobs + plan.assets:
+        if item[0] in plan.errors:
+            input_type = registry.match(item[0])
+            processor = registry.processor_name(input_type) if input_type is not None else COPY_PROCESSOR
+            _record_failure(summary, processor, item, plan.errors[item[0]], 0.0)
+
+    manifest = None
+    if incremental:
+        # A run over every registered type keeps the plain manifest name of the runs before types were scoped
+        input_types = () if set(registry.types) == set(PROCESSORS) else sorted(registry.types)
+        manifest = Manifest(output_folder, manifest_name(input_types, shard)).load()
+        versions = {}
+
+        def version_of(input_path):
+            input_type = registry.match(input_path)
+            if input_type not in versions:
+                versions[input_type] = processor_version(registry.get(input_type))
+            return versions[input_type]
+
+        jobs, job_states = _filter_unchanged(manifest, input_folder, jobs, version_of, summary)
+        assets, asset_states = _filter_unchanged(manifest, input_folder, assets, lambda _: COPY_PROCESSOR, summary)
+
+    deduplicator = None
+    if dedup is not None:
+        # An incremental run already knows the digests, no need to read the inputs again
+        digest_of = (lambda path: job_states[path][1]) if manifest is not None else file_digest
+        deduplicator = Deduplicator(registry, sizes, digest_of)
+        jobs = deduplicator.split(jobs)
+        summary.dedup = deduplicator
+
+    # Create the whole output tree up front so workers never race on makedirs
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    _unlink_shared(jobs)
+
+    if queue is not None:
+        jobs = _claimed(jobs, input_folder, queue)
+        assets = _claimed(assets, input_folder, queue)
+    if timeout or memory_limit:
+        executor = IsolatedExecutor(workers, init_worker, (registry, profile is not None, False, True), process_job,
+                                    timeout, memory_limit)
+        results = executor.map(jobs)
+    elif pipeline:
+        results = run_pipeline(registry, jobs, workers, io_threads, prefetch, profile is not None)
+    else:
+        results = execute(registry, process_job, jobs, workers, workers * 4, profile is not None)
+    for job, error, spans, elapsed in results:
+        if spans is not None:
+            profile.merge(spans)
+        copies = deduplicator.copies_of(job[0]) if deduplicator is not None else ()
+        for item in (job, *copies):
+            item_error = error
+            if item is not job and error is None:
+                try:
+                    dedup.mirror(job[1], item[1])
+                except OSError:
+                    item_error = traceback.format_exc()
+            if item_error:
+                _record_failure(summary, registry.processor_name(registry.match(item[0])), item, item_error, elapsed,
+                                sizes[item[0]])
+                if manifest is not None:
+                    manifest.forget(job_states[item[0]][0])
+            else:
+                summary.telemetry.processed(registry.processor_name(registry.match(item[0])), sizes[item[0]])
+                summary.processed += 1
+                if manifest is not None:
+                    manifest.record(*job_states[item[0]], item[1])
+        if queue is not None:
+            if error:
+                queue.release(relative_key(job[0], input_folder))
+            else:
+                queue.complete(relative_key(job[0], input_folder))
+
+    for input_path, output_path in assets:
+        try:
+            _, written = copier.mirror(input_path, output_path)
+        except OSError:
+            _record_failure(summary, COPY_PROCESSOR, (input_path, output_path), traceback.format_exc(), 0.0)
+            if manifest is not None:
+                manifest.forget(asset_states[input_path][0])
+            if queue is not None:
+                queue.release(relative_key(input_path, input_folder))
+            continue
+        summary.copied += 1
+        summary.telemetry.copied(sizes[input_path], written)
+        if manifest is not None:
+            manifest.record(*asset_states[input_path], output_path)
+        if queue is not None:
+            queue.complete(relative_key(input_path, input_folder))
+
+    if manifest is not None:
+        summary.pruned = manifest.prune()
+        manifest.save()
+    if quarantine_path:
+        summary.quarantine.write(quarantine_path)
+    if queue is not None:
+        summary.queue = queue
+        summary.unfinished = queue.unfinished()
+
+    return _finish(summary, telemetry_path, prometheus_path)
+
+
+def run_stream(process_object, input_path, output_path, input_type=None, out_type=None, workers=None, profile=None,
+               progress_interval=30.0, telemetry_path=None, prometheus_path=None, shard_files=None, shard_bytes=None,
+               prefetch=16, shard=None, assets=None):
+    # Converts the members of an input archive or tree straight into an output tree, archive shards or JSON
+    # Lines shards, so neither side needs one file on disk per document. Assets are copied as they stream past.
+    registry = as_registry(process_object, input_type, out_type)
+    copier = assets if assets is not None else AssetCopier()
+    workers = workers or os.cpu_count() or 1
+    summary = RunSummary(RunTelemetry(*input_totals(input_path), progress_interval))
+    summary.profile = profile
+
+    with open_sink(output_path, shard_files, shard_bytes) as sink:
+        def documents():
+            # Jobs carry their size, an archive may hold several members of the same name
+            for name, data in iter_inputs(input_path):
+                if not in_shard(name, shard):
+                    continue
+                input_type = registry.match(name)
+                if input_type is not None:
+                    yield (name, registry.output_name(name, input_type), len(data)), data
+                elif sink.accepts_assets and not copier.excluded(name, len(data)):
+                    sink.write(name, data)
+                    summary.copied += 1
+                    summary.telemetry.copied(len(data))
+
+        for job, error, text, spans, _ in convert_all(registry, documents(), workers, prefetch,
+                                                      profile is not None, sink.records):
+            input_type = registry.match(job[0])
+            if spans is not None:
+                profile.merge(spans)
+            if error is None:
+                try:
+                    if sink.records:
+                        sink.write_record(job[0], *text)
+                    else:
+                        sink.write(job[1], text, registry.output_encoding(input_type))
+                except Exception:
+                    error = traceback.format_exc()
+            summary.telemetry.processed(registry.processor_name(input_type), job[2],
+                                        failed=error is not None)
+            if error:
+                summary.failures.append((job[0], error))
+                print(f'Failed to process {job[0]}:\n{error}', file=sys.stderr)
+            else:
+                summary.processed += 1
+
+    return _finish(summary, telemetry_path, prometheus_path)
+
+
+def _finish(summary, telemetry_path, prometheus_path):
+    summary.telemetry.finish()
+    if telemetry_path:
+        summary.telemetry.write_json(telemetry_path)
+    if prometheus_path:
+        summary.telemetry.write_prometheus(prometheus_path)
+    summary.report()
+    return summary
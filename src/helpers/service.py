@@ -0,0 +1,199 @@
+import base64
+import json
+import os
+import socket
+import socketserver
+import stat
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+
+class ServiceError(Exception):
+    pass
+
+
+class ConversionService:
+    # Keeps the processors of a ProcessorRegistry warm and converts jobs sent as JSON lines:
+    #   {"id": ..., "path": "in.html"} or {"id": ..., "type": ".html", "content": "..."} (or "contentBase64"),
+    #   optionally with "output": "out.json" to write the result there instead of returning it.
+    # Every job gets one response line {"id", "ok", "output" or "outputPath", "seconds"} or {"id", "ok", "error"}.
+    def __init__(self, registry):
+        self.registry = registry
+        # Processors and the profiling spans are not written for concurrent use, connections take turns
+        self.lock = threading.Lock()
+
+    def handle(self, job):
+        started = time.perf_counter()
+        response = {'id': job.get('id'), 'ok': True}
+        try:
+            response.update(self._convert(job))
+        except Exception as error:
+            response.update(ok=False, error=f'{type(error).__name__}: {error}', traceback=traceback.format_exc())
+        response['seconds'] = time.perf_counter() - started
+        return response
+
+    def _convert(self, job):
+        path = job.get('path')
+        input_type = job.get('type') or (self.registry.match(path) if path else None)
+        if input_type not in self.registry.types:
+            raise ServiceError(f'No processor for input type {input_type!r}')
+        if 'content' in job:
+            content = job['content']
+        elif 'contentBase64' in job:
+            content = base64.b64decode(job['contentBase64'])
+        elif path:
+            with open(path, 'rb') as file:
+                content = file.read()
+        else:
+            raise ServiceError('A job needs a path, content or contentBase64')
+        with self.lock:
+            process_object = self.registry.get(input_type)
+            output = process_object.convert(content, path or '')
+        if job.get('output'):
+            with open(job['output'], 'w', encoding=process_object.output_encoding) as file:
+                file.write(output)
+            return {'outputPath': job['output']}
+        return {'output': output}
+
+    def handle_line(self, line):
+        try:
+            job = json.loads(line)
+        except ValueError as error:
+            return {'id': None, 'ok': False, 'error': f'Malformed job: {error}'}
+        if not isinstance(job, dict):
+            return {'id': None, 'ok': False, 'error': f'Malformed job: expected an object, got {type(job).__name__}'}
+        return self.handle(job)
+
+    def serve_stream(self, reader, writer):
+        # One job per line in, one response per line out, until the reader is closed
+        for line in reader:
+            if line.strip():
+                writer.write(json.dumps(self.handle_line(line), ensure_ascii=False).encode('utf-8') + b'\n')
+                writer.flush()
+
+    def serve_stdio(self):
+        # The processors print warnings to stdout, keep those off the response stream
+        writer = sys.stdout.buffer
+        sys.stdout = sys.stderr
+        try:
+            self.serve_stream(sys.stdin.buffer, writer)
+        finally:
+            sys.stdout = sys.__stdout__
+
+    def serve_unix(self, socket_path):
+        service = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                service.serve_stream(self.rfile, self.wfile)
+
+        _remove_stale_socket(socket_path)
+        server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        server.daemon_threads = True
+        print(f'Serving conversions on {socket_path}', file=sys.stderr, flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.remove(socket_path)
+
+
+def _remove_stale_socket(socket_path):
+    # A socket left by a service that died is removed, anything else at the path is refused rather than deleted
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ServiceError(f'{socket_path} exists and is not a socket')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise ServiceError(f'Another service is listening on {socket_path}')
+
+
+class ServiceClient:
+    def __init__(self, reader, writer, closer=None):
+        self.reader = reader
+        self.writer = writer
+        self.closer = closer
+        self.next_id = 0
+
+    @classmethod
+    def connect(cls, socket_path, timeout=None):
+        # Waits up to timeout seconds for a service that is still starting to create its socket
+        deadline = time.monotonic() + (timeout or 0)
+        while True:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                connection.connect(socket_path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                connection.close()
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+        reader, writer = connection.makefile('rb'), connection.makefile('wb')
+
+        def close():
+            writer.close()
+            reader.close()
+            connection.close()
+
+        return cls(reader, writer, close)
+
+    @classmethod
+    def spawn(cls, command):
+        # Starts a service speaking the protocol on its stdin and stdout, e.g. [python, app.py, --serve]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        def close():
+            process.stdin.close()
+            process.wait()
+
+        return cls(process.stdout, process.stdin, close)
+
+    def request(self, **job):
+        self.next_id += 1
+        job.setdefault('id', self.next_id)
+        self.writer.write(json.dumps(job, ensure_ascii=False).encode('utf-8') + b'\n')
+        self.writer.flush()
+        line = self.reader.readline()
+        if not line:
+            raise ServiceError('The conversion service closed the connection')
+        return json.loads(line)
+
+    def convert(self, path=None, content=None, input_type=None, output=None):
+        # Returns the converted document, or the output path when the service wrote it to output
+        # Paths are resolved here, the service may run in another working directory
+        job = {'path': path and os.path.abspath(path), 'type': input_type,
+               'output': output and os.path.abspath(output)}
+        if isinstance(content, bytes):
+            job['contentBase64'] = base64.b64encode(content).decode('ascii')
+        elif content is not None:
+            job['content'] = content
+        response = self.request(**{key: value for key, value in job.items() if value is not None})
+        if not response['ok']:
+            raise ServiceError(response['error'])
+        return response.get('outputPath') or response['output']
+
+    def close(self):
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
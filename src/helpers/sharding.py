@@ -0,0 +1,123 @@
+import argparse
+import hashlib
+import os
+import socket
+import time
+
+
+def parse_shard(text):
+    # argparse type for --shard i/N, shards are numbered from 0
+    try:
+        index, count = (int(part) for part in text.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected a shard as i/N, got {text!r}')
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f'shard index must be in 0..{count - 1}, got {text!r}')
+    return index, count
+
+
+def relative_key(path, folder):
+    # The same relative posix path on every machine, whatever the mount point of the tree
+    return os.path.relpath(path, folder).replace(os.sep, '/')
+
+
+def shard_of(key, count):
+    # Stable across machines and Python runs, unlike hash() which is salted per process
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big') % count
+
+
+def in_shard(key, shard):
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+class WorkQueue:
+    # Dynamic load balancing over shared storage: every machine walks the same plan and takes a file only if it
+    # wins the exclusive create of that file's claim, so faster machines simply claim more. A claim is a lease:
+    # once the file is done the claim is marked done and kept, delete the queue folder to start a fresh rebuild.
+    # An unfinished claim older than lease seconds is taken to belong to a machine that crashed and is taken over.
+    def __init__(self, folder, lease=None):
+        self.folder = folder
+        self.lease = lease
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self.taken_over = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def claim_path(self, key):
+        return os.path.join(self.folder, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.claim')
+
+    def claim(self, key):
+        path = self.claim_path(key)
+        if self._create(path, key):
+            return True
+        if self.lease is None:
+            return False
+        claim = read_claim(path)
+        if claim is None or claim['done'] or time.time() - claim['time'] < self.lease:
+            return False
+        # Machines that read the same stale claim race for the exclusive create of a takeover marker named after
+        # it. The winner swaps its own claim in only if the claim is still that stale one, a machine acting on an
+        # older read then finds the fresh claim and backs off.
+        stale = f'{claim["owner"]} {claim["time"]:.0f}'
+        marker = f'{path}.{hashlib.sha1(stale.encode("utf-8")).hexdigest()[:12]}.takeover'
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            return False
+        try:
+            current = read_claim(path)
+            if current is None or (current['owner'], current['time']) != (claim['owner'], claim['time']):
+                return False
+            tmp_path = f'{path}.{socket.gethostname()}-{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(self._claim_line(key))
+            os.replace(tmp_path, path)
+        finally:
+            os.remove(marker)
+        self.taken_over += 1
+        return True
+
+    def _create(self, path, key):
+        try:
+            descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+            file.write(self._claim_line(key))
+        return True
+
+    def _claim_line(self, key):
+        return f'{self.owner} {time.time():.0f} {key}\n'
+
+    def complete(self, key):
+        # Marks the claim done so it is never taken over
+        with open(self.claim_path(key), 'a', encoding='utf-8') as file:
+            file.write(f'done {time.time():.0f}\n')
+
+    def release(self, key):
+        # Gives a failed file back so another machine, or a later run, can retry it
+        try:
+            os.remove(self.claim_path(key))
+        except FileNotFoundError:
+            pass
+
+    def unfinished(self):
+        # Claims not marked done, held by machines still working on them or by machines that crashed
+        claims = []
+        for name in sorted(os.listdir(self.folder)):
+            if name.endswith('.claim'):
+                claim = read_claim(os.path.join(self.folder, name))
+                if claim is not None and not claim['done']:
+                    claims.append(claim)
+        return claims
+
+
+def read_claim(path):
+    # The owner, claim time, key and done flag of a claim file, None while it is missing or still being written
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            lines = file.read().splitlines()
+        owner, claimed, key = lines[0].split(' ', 2)
+        return {'owner': owner, 'time': float(claimed), 'key': key,
+                'done': any(line.startswith('done ') for line in lines[1:])}
+    except (OSError, IndexError, ValueError):
+        return None
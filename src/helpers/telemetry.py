@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import time
+
+METRIC_PREFIX = 'xmltohtml'
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return f'{seconds // 3600:d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def _write_atomic(path, text):
+    # The node exporter textfile collector may read at any time, so never expose a half written file
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+class RunTelemetry:
+    def __init__(self, total_files=0, total_bytes=0, progress_interval=30.0, stream=sys.stderr):
+        # total_files and total_bytes come from the pre-scan of the input tree and drive the ETA
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.progress_interval = progress_interval
+        self.stream = stream
+        self.started = time.time()
+        self.started_monotonic = time.monotonic()
+        self.last_progress = self.started_monotonic
+        # processor name -> [files, bytes, failed]
+        self.processors = {}
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.copied_written_bytes = 0
+        self.finished = None
+
+    @property
+    def done_files(self):
+        return (sum(files + failed for files, _, failed in self.processors.values()) + self.skipped_files
+                + self.copied_files)
+
+    @property
+    def done_bytes(self):
+        return sum(size for _, size, _ in self.processors.values()) + self.skipped_bytes + self.copied_bytes
+
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started_monotonic
+
+    def processed(self, processor, size, failed=False):
+        counts = self.processors.setdefault(processor, [0, 0, 0])
+        if failed:
+            counts[2] += 1
+        else:
+            counts[0] += 1
+        counts[1] += size
+        self._maybe_report()
+
+    def skipped(self, size):
+        self.skipped_files += 1
+        self.skipped_bytes += size
+        self._maybe_report()
+
+    def copied(self, size, written=None):
+        # written is what mirroring the asset really wrote, nothing for a link or an unchanged output
+        self.copied_files += 1
+        self.copied_bytes += size
+        self.copied_written_bytes += size if written is None else written
+        self._maybe_report()
+
+    def eta(self):
+        # Remaining bytes at the byte rate seen so far, skipped inputs are excluded as they cost no work
+        worked = self.done_bytes - self.skipped_bytes
+        remaining = self.total_bytes - self.done_bytes
+        elapsed = self.elapsed()
+        if worked <= 0 or elapsed <= 0:
+            return None
+        return max(0.0, remaining / (worked / elapsed))
+
+    def _maybe_report(self):
+        if not self.progress_interval:
+            return
+        now = time.monotonic()
+        if now - self.last_progress < self.progress_interval:
+            return
+        self.last_progress = now
+        eta = self.eta()
+        elapsed = self.elapsed()
+        print(f'[{_format_duration(elapsed)}] {self.done_files}/{self.total_files} files, '
+              f'{self.done_bytes / 1e6:.1f}/{self.total_bytes / 1e6:.1f} MB, '
+              f'{self.done_files / elapsed:.1f} files/s, ETA {_format_duration(eta) if eta is not None else "?"}',
+              file=self.stream, flush=True)
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    def summary(self):
+        elapsed = self.elapsed()
+        return {
+            'started': self.started,
+            'elapsed_seconds': elapsed,
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'processors': {
+                name: {
+                    'files': files,
+                    'failed': failed,
+                    'bytes': size,
+                    'files_per_second': (files + failed) / elapsed if elapsed else None,
+                    'bytes_per_second': size / elapsed if elapsed else None,
+                } for name, (files, size, failed) in self.processors.items()
+            },
+            'skipped': {'files': self.skipped_files, 'bytes': self.skipped_bytes},
+            'copied': {'files': self.copied_files, 'bytes': self.copied_bytes,
+                       'bytes_written': self.copied_written_bytes},
+            'failed': sum(failed for _, _, failed in self.processors.values()),
+        }
+
+    def report(self):
+        elapsed = self.elapsed()
+        for name, (files, size, failed) in sorted(self.processors.items()):
+            rate = (files + failed) / elapsed if elapsed else 0.0
+            print(f'{name}: {files + failed} files in {elapsed:.1f}s, {rate:.1f} files/s, '
+                  f'{size / elapsed / 1e6 if elapsed else 0.0:.2f} MB/s')
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path):
+        summary = self.summary()
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} gauge')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if label_text
+                             else f'{METRIC_PREFIX}_{name} {value}')
+
+        processors = summary['processors']
+        metric('files', 'Files handled by the last run',
+               [({'processor': name, 'status': 'processed'}, stats['files']) for name, stats in processors.items()]
+               + [({'processor': name, 'status': 'failed'}, stats['failed']) for name, stats in processors.items()]
+               + [({'processor': 'copy', 'status': 'copied'}, summary['copied']['files']),
+                  ({'processor': 'manifest', 'status': 'skipped'}, summary['skipped']['files'])])
+        metric('bytes', 'Input bytes handled by the last run',
+               [({'processor': name}, stats['bytes']) for name, stats in processors.items()]
+               + [({'processor': 'copy'}, summary['copied']['bytes']),
+                  ({'processor': 'manifest'}, summary['skipped']['bytes'])])
+        metric('asset_bytes_written', 'Bytes the last run actually wrote to mirror assets',
+               [({}, summary['copied']['bytes_written'])])
+        metric('files_per_second', 'Processing throughput of the last run in files per second',
+               [({'processor': name}, stats['files_per_second'] or 0) for name, stats in processors.items()])
+        metric('bytes_per_second', 'Processing throughput of the last run in input bytes per second',
+               [({'processor': name}, stats['bytes_per_second'] or 0) for name, stats in processors.items()])
+        metric('run_duration_seconds', 'Wall clock duration of the last run', [({}, summary['elapsed_seconds'])])
+        metric('run_start_timestamp_seconds', 'Start time of the last run', [({}, summary['started'])])
+        _write_atomic(path, '\n'.join(lines) + '\n')
@@ -0,0 +1,71 @@
+import os
+import shutil
+
+from src.helpers.planning import plan_files
+
+# Bookkeeping files the runs leave in an output folder next to the converted documents
+IGNORED_PREFIXES = ('.manifest', '.quarantine')
+
+
+class VerifyReport:
+    def __init__(self):
+        self.expected = 0
+        self.missing = []
+        self.duplicated = []
+        self.unexpected = []
+        self.merged = 0
+
+    @property
+    def ok(self):
+        return not self.missing and not self.duplicated
+
+    def report(self):
+        print(f'Verified {self.expected} expected outputs: {len(self.missing)} missing, '
+              f'{len(self.duplicated)} written by more than one shard, {len(self.unexpected)} unexpected'
+              + (f', merged {self.merged}' if self.merged else ''))
+        for label, paths in (('missing', self.missing), ('duplicated', self.duplicated),
+                             ('unexpected', self.unexpected)):
+            for path in paths[:20]:
+                print(f'  {label}: {path}')
+            if len(paths) > 20:
+                print(f'  ... {len(paths) - 20} more {label}')
+
+
+def _output_files(folder):
+    for current, _, files in os.walk(folder):
+        for item in files:
+            if not item.startswith(IGNORED_PREFIXES):
+                yield os.path.relpath(os.path.join(current, item), folder).replace(os.sep, '/')
+
+
+def verify_outputs(input_folder, output_folders, registry, merge_into=None, assets=None):
+    # Checks that the union of the shard output folders holds exactly one output for every input and copies
+    # them into merge_into when it is given. The folders may be the same shared folder or one per machine.
+    # assets is the AssetCopier of the runs, the assets it excluded are not expected
+    _, jobs, asset_jobs = plan_files(input_folder, '', registry)
+    if assets is not None:
+        asset_jobs = [item for item in asset_jobs if not assets.excluded(item[1].replace(os.sep, '/'))]
+    expected = {output_path.replace(os.sep, '/') for _, output_path in jobs + asset_jobs}
+    owners = {}
+    report = VerifyReport()
+    report.expected = len(expected)
+    for folder in dict.fromkeys(os.path.abspath(folder) for folder in output_folders):
+        for relative in _output_files(folder):
+            if relative in expected:
+                owners.setdefault(relative, []).append(folder)
+            else:
+                report.unexpected.append(os.path.join(folder, relative))
+    for relative in sorted(expected):
+        folders = owners.get(relative, ())
+        if not folders:
+            report.missing.append(relative)
+            continue
+        if len(folders) > 1:
+            report.duplicated.append(relative)
+        if merge_into is not None and os.path.abspath(merge_into) != folders[0]:
+            target = os.path.join(merge_into, *relative.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(folders[0], *relative.split('/')), target)
+            report.merged += 1
+    report.report()
+    return report
@@ -1,5 +1,148 @@
+import io
 import json
-from typing import List, Dict, Any
+from array import array
+from typing import List, Iterable
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, it only speeds up the compact output
+    orjson = None
+
+# Fields whose lists are written element by element instead of being encoded in one piece
+STREAMED_LISTS = ('sections', 'tables')
+
+
+def _to_dict(o):
+    return o.to_dict() if hasattr(o, 'to_dict') else o.__dict__
+
+
+def encode_value(value, indent=4, level=0):
+    # Encodes one value as it appears nested `level` deep in the document, indent=None is compact
+    if indent is None:
+        if orjson is not None:
+            return orjson.dumps(value, default=_to_dict).decode('utf-8')
+        return json.dumps(value, default=_to_dict, separators=(',', ':'), ensure_ascii=False)
+    text = json.dumps(value, default=_to_dict, indent=indent)
+    return text.replace('\n', '\n' + ' ' * (indent * level)) if level else text
+
+
+def write_value(file, value, indent=4, level=0):
+    # Writes the same text as json.dumps(value, indent=indent), streaming the members of objects and
+    # the items of the large lists so only one section or table is encoded in memory at a time
+    if hasattr(value, 'to_dict'):
+        value = value.to_dict()
+    if not isinstance(value, dict) or not value:
+        file.write(encode_value(value, indent, level))
+        return
+    if indent is None:
+        separator, colon, newline, pad, closing_pad = ',', ':', '', '', ''
+    else:
+        separator, colon, newline = ',', ': ', '\n'
+        pad, closing_pad = ' ' * (indent * (level + 1)), ' ' * (indent * level)
+    file.write('{')
+    for position, (key, member) in enumerate(value.items()):
+        file.write((separator if position else '') + newline + pad + encode_value(key, indent) + colon)
+        if isinstance(member, dict) or hasattr(member, 'to_dict'):
+            write_value(file, member, indent, level + 1)
+        elif key in STREAMED_LISTS and member:
+            file.write('[')
+            item_pad = pad + ' ' * indent if indent is not None else ''
+            for item_position, item in enumerate(member):
+                file.write((separator if item_position else '') + newline + item_pad)
+                file.write(encode_value(item, indent, level + 2))
+            file.write(newline + pad + ']')
+        else:
+            file.write(encode_value(member, indent, level + 1))
+    file.write(newline + closing_pad + '}')
+
+
+class Image:
+    __slots__ = ('altText', 'link', 'name')
+
+    def __init__(self, altText: str = "", link: str = "", name: str = ""):
+        self.altText = altText
+        self.link = link
+        self.name = name
+
+    def to_dict(self):
+        return {
+            "altText": self.altText,
+            "link": self.link,
+            "name": self.name
+        }
+
+
+class Table:
+    # Cells of every row live in one flat list, row_offsets[i]:row_offsets[i + 1] slices out row i
+    __slots__ = ('name', 'cells', 'row_offsets')
+
+    def __init__(self, name: str = None, rows: Iterable[List[str]] = ()):
+        self.name = name
+        self.cells: List[str] = []
+        self.row_offsets = array('I', [0])
+        for row in rows:
+            self.add_row(row)
+
+    def add_row(self, cells: List[str]):
+        self.cells.extend(cells)
+        self.row_offsets.append(len(self.cells))
+
+    @property
+    def row_count(self):
+        return len(self.row_offsets) - 1
+
+    @property
+    def col_count(self):
+        return self.row_offsets[1] if self.row_count else 0
+
+    def rows(self):
+        offsets = self.row_offsets
+        return [self.cells[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+    def to_dict(self):
+        return {
+            "rowCount": self.row_count,
+            "colCount": self.col_count,
+            "name": self.name,
+            "rows": self.rows()
+        }
+
+
+class Section:
+    __slots__ = ('title', 'key', 'content', 'tables', 'images')
+
+    def __init__(self, title: str = "", key: str = "", content: str = "", tables: List[Table] = None,
+                 images: List[Image] = None):
+        self.title = title
+        self.key = key
+        self.content = content
+        self.tables = tables if tables is not None else []
+        self.images = images if images is not None else []
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "key": self.key,
+            "content": self.content,
+            "tables": self.tables,
+            "images": self.images
+        }
+
+
+class Schedule:
+    __slots__ = ('content', 'tables', 'images')
+
+    def __init__(self, content: str = "", tables: List[Table] = None, images: List[Image] = None):
+        self.content = content
+        self.tables = tables if tables is not None else []
+        self.images = images if images is not None else []
+
+    def to_dict(self):
+        return {
+            "content": self.content,
+            "tables": self.tables,
+            "images": self.images
+        }
 
 
 class Statute:
@@ -13,13 +156,9 @@ class Statute:
         self.dateOfGazette = dateOfGazette
         self.listOfSections = listOfSections
         self.preamble = preamble
-        self.schedule = {
-            "content": "",
-            "tables": [],
-            "images": []
-        }
+        self.schedule = Schedule()
         self.preSectionsText = preSectionsText
-        self.sections: List[Dict[str, Any]] = []
+        self.sections: List[Section] = []
         self.footnotes = footnotes
         self.endnotes = endnotes
         self.statuteId = statuteId
@@ -27,33 +166,24 @@ class Statute:
         self.isEffectiveDateUnavailable = isEffectiveDateUnavailable
         self.isDateOfGazetteUnavailable = isDateOfGazetteUnavailable
 
-    def add_section(self, title: str = "", key: str = "", content: str = "", tables: List[dict] = None,
-                    images: List[str] = None):
-        if tables is None:
-            tables = []
-        if images is None:
-            images = []
-
-        section = {
-            "title": title,
-            "key": key,
-            "content": content,
-            "tables": tables,
-            "images": images
-        }
-        self.sections.append(section)
-
-    def add_schedule(self, content: str = "", tables: List[dict] = None,
-                     images: List[str] = None):
-        if tables is None:
-            tables = []
-        if images is None:
-            images = []
-        self.schedule = {
-            "content": content,
-            "tables": tables,
-            "images": images
-        }
+    def add_section(self, title: str = "", key: str = "", content: str = "", tables: List[Table] = None,
+                    images: List[Image] = None):
+        self.sections.append(Section(title=title, key=key, content=content, tables=tables, images=images))
+
+    def add_schedule(self, content: str = "", tables: List[Table] = None,
+                     images: List[Image] = None):
+        self.schedule = Schedule(content=content, tables=tables, images=images)
+
+    def to_json(self, indent=4):
+        buffer = io.StringIO()
+        self.write_json(buffer, indent)
+        return buffer.getvalue()
+
+    def write_json(self, file, indent=4):
+        write_value(file, self.__dict__, indent)
 
-    def to_json(self):
-        return json.dumps(self, default=lambda o: o.__dict__, indent=4)
+    def to_json_line(self, source_path=''):
+        # Compact record for JSON Lines batches, led by the path of the page it was extracted from
+        buffer = io.StringIO()
+        write_value(buffer, {'sourcePath': source_path, **self.__dict__}, indent=None)
+        return buffer.getvalue()
@@ -0,0 +1,30 @@
+import os
+from functools import lru_cache
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template
+
+from src.parser.html_template import html_template
+
+
+# Templates are compiled lazily and cached per process, so pool workers each compile once
+# on their first file and reuse the result for the rest of the run
+@lru_cache(maxsize=None)
+def get_case_template():
+    return Template(html_template)
+
+
+@lru_cache(maxsize=None)
+def _file_environment(directory, bytecode_directory):
+    bytecode_cache = None
+    if bytecode_directory:
+        os.makedirs(bytecode_directory, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(bytecode_directory)
+    # auto_reload is off so cached templates are not re-stat'ed on every lookup
+    return Environment(loader=FileSystemLoader(directory), bytecode_cache=bytecode_cache, auto_reload=False)
+
+
+def get_template(template_path=None, bytecode_directory=None):
+    if template_path is None:
+        return get_case_template()
+    directory, name = os.path.split(os.path.abspath(template_path))
+    return _file_environment(directory, bytecode_directory).get_template(name)
@@ -0,0 +1,58 @@
+import warnings
+import xml.etree.ElementTree as et
+
+STDLIB = 'stdlib'
+LXML = 'lxml'
+AUTO = 'auto'
+BACKENDS = (STDLIB, LXML, AUTO)
+
+
+_lxml_etree = None
+
+
+def lxml_etree():
+    # lxml.etree, imported on first use so stdlib runs never pay for it, None when lxml is not installed
+    global _lxml_etree
+    if _lxml_etree is None:
+        try:
+            from lxml import etree
+        except ImportError:  # lxml is optional, the stdlib parsers are always available
+            return None
+        _lxml_etree = etree
+    return _lxml_etree
+
+
+def resolve_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown parser backend {backend!r}, expected one of {", ".join(BACKENDS)}')
+    if backend == STDLIB:
+        return STDLIB
+    if lxml_etree() is None:
+        if backend == LXML:
+            warnings.warn('lxml is not installed, falling back to the stdlib parsers')
+        return STDLIB
+    return LXML
+
+
+def html_parser_name(backend):
+    # BeautifulSoup tree builder for the backend
+    return 'lxml' if backend == LXML else 'html.parser'
+
+
+def _lxml_parser_options():
+    # Drop comments and processing instructions like ElementTree does, so they never show up as
+    # children of the elements the extraction code walks
+    return {'remove_comments': True, 'remove_pis': True, 'huge_tree': True}
+
+
+def parse_xml(source, backend=STDLIB):
+    if backend == LXML:
+        etree = lxml_etree()
+        return etree.parse(source, etree.XMLParser(**_lxml_parser_options())).getroot()
+    return et.parse(source).getroot()
+
+
+def iterparse_xml(source, events, backend=STDLIB):
+    if backend == LXML:
+        return lxml_etree().iterparse(source, events=events, **_lxml_parser_options())
+    return et.iterparse(source, events=events)
@@ -1,3 +1,36 @@
+import importlib
+import json
+
+
 class IProcess:
+    # Bump when a change alters the generated output, it invalidates incremental rebuild manifests
+    version = '1'
+    # Encoding of the documents convert() returns when they are written out, None is the platform default
+    output_encoding = None
+    # Modules besides the processor's own whose code shapes its output: templates, records, parser backends
+    output_modules = ('src.service.process',)
+
     def process_file(self, xml_path, output_path):
         pass
+
+    def convert(self, content, source_name=''):
+        # Converts one input document given as bytes or str and returns the output document as str
+        raise NotImplementedError
+
+    def convert_record(self, content, source_name=''):
+        # Converts one input document into a compact single line JSON record for batch output and returns
+        # the key the record is indexed under together with the line
+        record = {'sourcePath': source_name, 'content': self.convert(content, source_name)}
+        return source_name, json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+
+    def fingerprint(self):
+        return f'{type(self).__name__}:{self.version}'
+
+    def warm(self):
+        # Loads what the first conversion would otherwise pay for, e.g. compiling a template
+        pass
+
+    def output_sources(self):
+        # Files whose contents shape the output, an edit to any of them invalidates incremental rebuilds
+        modules = (type(self).__module__, *self.output_modules)
+        return [getattr(importlib.import_module(name), '__file__', None) for name in modules]
@@ -1,139 +1,269 @@
+import bisect
 import locale
-import math
 import re
 from datetime import datetime
 
-from src.parser.json_template import Statute
+from src.helpers.profiling import span
+from src.parser.json_template import Image, Statute, Table
+from src.service.backend import STDLIB, html_parser_name, resolve_backend
 from src.service.process import IProcess
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+# Class patterns, matched against each class of an element the way bs4 matches class_ regexes
+LEG_P1_CONTAINER = re.compile(r'^LegP1Container')
+LEG_DISPLAY_IMAGE = re.compile(r'^LegDisplayImage')
+LEG_GROUP_TITLE = re.compile(r'^LegP1GroupTitle|LegPblockTitle')
+LEG_DATE_OF_ENACTMENT = re.compile(r'^LegDateOfEnactment')
+LEG_SCHEDULE = re.compile(r'LegSchedule')
+LEG_TABULAR = re.compile(r'LegTabular')
+# Section headings, checked against the tag name, the lower-cased text and the id of a child
+SECTION_HEADING_TAG = re.compile(r'^h[1-6]+')
+SECTION_HEADING_TEXT = re.compile(r'^section *[0-9]+')
+SECTION_ID = re.compile(r'^section[- ][0-9]+$')
+
+# Everything the extractors read lives in the title or under one of these classes
+KEPT_TAGS = {'title'}
+KEPT_CLASSES = {'LegPrelims', 'LegLongTitle', 'LegNo', 'DocContainer'}
+KEPT_CLASS_PREFIXES = ('LegDateOfEnactment', 'LegP1Container')
+
+
+def _keeps_tag(name, attrs):
+    if name in KEPT_TAGS:
+        return True
+    classes = attrs.get('class') if attrs else None
+    if not classes:
+        return False
+    if isinstance(classes, str):
+        classes = classes.split()
+    return any(cls in KEPT_CLASSES or cls.startswith(KEPT_CLASS_PREFIXES) for cls in classes)
+
+
+class LegislationStrainer(SoupStrainer):
+    # Only builds the subtrees the extractors read, the page chrome around them is never materialized.
+    # Once a tag is kept bs4 keeps its whole subtree, the filter only decides at the top level.
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return _keeps_tag(name, attrs)
+
+    def allow_string_creation(self, string):
+        return False
+
+    def search_tag(self, markup_name=None, markup_attrs={}):
+        # bs4 before 4.13 filters start tags through search_tag and strings through search
+        return _keeps_tag(markup_name, markup_attrs)
+
+    def search(self, markup):
+        return None
+
 
+def _position(item):
+    return item[0]
+
+
+class SoupIndex:
+    # Maps every CSS class and tag name of a parsed document to its elements, built in one pass over
+    # the soup. Elements keep their document order position and the span of their subtree, so lookups
+    # scoped to an element are a bisect instead of another walk of that subtree.
+    def __init__(self, soup):
+        self.soup = soup
+        self.classes = {}
+        self.names = {}
+        self.spans = {}
+        self._matches = {}
+        self._texts = {}
+        open_tags = []
+        position = -1
+        for position, node in enumerate(node for node in soup.descendants if isinstance(node, Tag)):
+            while open_tags and open_tags[-1] is not node.parent:
+                closed = open_tags.pop()
+                self.spans[id(closed)] = (self.spans[id(closed)][0], position - 1)
+            open_tags.append(node)
+            self.spans[id(node)] = (position, position)
+            self.names.setdefault(node.name, []).append((position, node))
+            for cls in node.get('class') or ():
+                self.classes.setdefault(cls, []).append((position, node))
+        for closed in open_tags:
+            self.spans[id(closed)] = (self.spans[id(closed)][0], position)
+
+    def _elements(self, class_):
+        # class_ is an exact class name or a compiled pattern searched in each class name
+        found = self._matches.get(class_)
+        if found is None:
+            if isinstance(class_, str):
+                found = self.classes.get(class_, [])
+            else:
+                found = sorted({position: node
+                                for cls, nodes in self.classes.items() if class_.search(cls)
+                                for position, node in nodes}.items(), key=_position)
+            self._matches[class_] = found
+        return found
+
+    def _range(self, found, within):
+        if within is None:
+            return 0, len(found)
+        start, end = self.spans[id(within)]
+        return (bisect.bisect_right(found, start, key=_position),
+                bisect.bisect_right(found, end, key=_position))
+
+    def find_all(self, class_, name=None, within=None):
+        found = self._elements(class_)
+        first, last = self._range(found, within)
+        return [node for _, node in found[first:last] if name is None or node.name == name]
+
+    def find(self, class_, name=None, within=None):
+        found = self._elements(class_)
+        first, last = self._range(found, within)
+        for _, node in found[first:last]:
+            if name is None or node.name == name:
+                return node
+        return None
+
+    def text(self, node):
+        # get_text() of a node, computed once and shared by the section and schedule walks
+        text = self._texts.get(id(node))
+        if text is None:
+            text = self._texts[id(node)] = node.get_text()
+        return text
 
-def get_list_sections(soup):
+    def find_name(self, name):
+        found = self.names.get(name)
+        return found[0][1] if found else None
+
+
+def get_list_sections(index):
     sections = ''
-    leg_p1_containers = soup.find_all(class_=re.compile(r'^LegP1Container'))
+    leg_p1_containers = index.find_all(LEG_P1_CONTAINER)
     if leg_p1_containers:
         for container in leg_p1_containers:
             sections += extract_space(container.text.strip()) + '\n'
     return sections
 
 
-def get_section(soup, statute):
-    doc_container = soup.find(class_='DocContainer')
-    start = False
-    all_text = False
-    title = ""
-    key = ""
-    content = ""
-    tables = []
+class SectionExtractor:
+    # Walks the DocContainer children as a state machine: before the first section heading nothing is
+    # kept, after a heading the section waits for its group title, after the title every child is content.
+    # Content is buffered in a list and joined once per section.
+    def __init__(self, index, statute):
+        self.index = index
+        self.statute = statute
+        self.started = False
+        self.collecting = False
+        self.title = ""
+        self.key = ""
+        self.content = []
+        self.tables = []
+
+    def feed(self, child):
+        text = self.index.text(child).strip()
+        lower_text = text.lower()
+        child_id = child.get('id')
+        if is_section_heading(child, lower_text, child_id):
+            self.flush()
+            self.title = ""
+            self.content = []
+            self.tables = []
+            self.started = True
+            self.collecting = False
+            self.key = section_key(child_id, lower_text)
+
+        extract_table(child, child.get('class'), self.tables)
+
+        group_title = self.index.find(LEG_GROUP_TITLE, within=child) if self.started else None
+        if group_title:
+            self.title = extract_space(self.index.text(group_title).strip())
+            self.collecting = True
+        elif self.collecting:
+            self.content.append(extract_space(text))
+
+    def flush(self):
+        if self.started:
+            self.statute.add_section(title=self.title, content=join_lines(self.content), key=self.key,
+                                     tables=self.tables)
+
+
+class ScheduleExtractor:
+    # Collects images and tables from every DocContainer child, and content from the first LegSchedule on
+    def __init__(self, index, statute):
+        self.index = index
+        self.statute = statute
+        self.started = False
+        self.title = ""
+        self.content = []
+        self.tables = []
+        self.images = []
+
+    def feed(self, child):
+        image = self.index.find(LEG_DISPLAY_IMAGE, within=child)
+        if image:
+            self.images.append(add_image(image.get('src'), self.title, len(self.images) + 1))
+        child_class = child.get('class')
+        extract_table(child, child_class, self.tables)
+        text = self.index.text(child)
+        if child_class and any(LEG_SCHEDULE.search(cls) for cls in child_class):
+            if not self.started and text:
+                self.title = text.strip()
+            self.started = True
+        text = text.strip()
+        if self.started and text:
+            self.content.append(extract_space(text))
+
+    def flush(self):
+        self.statute.add_schedule(content=join_lines(self.content), tables=self.tables, images=self.images)
+
+
+def is_section_heading(child, lower_text, child_id):
+    return bool((SECTION_HEADING_TAG.match(child.name) and lower_text and SECTION_HEADING_TEXT.match(lower_text))
+                or (child_id and SECTION_ID.match(child_id)))
+
+
+def section_key(child_id, lower_text):
+    if child_id and child_id.split('-') and len(child_id.split('-')) == 2:
+        return child_id.split('-')[1]
+    return extract_number(lower_text)
+
+
+def join_lines(lines):
+    return ''.join(line + '\n' for line in lines)
+
+
+def get_section(index, statute):
+    doc_container = index.find('DocContainer')
     if doc_container:
+        sections = SectionExtractor(index, statute)
         for child in doc_container.children:
             if child.name:
                 if child.name == 'div':
                     for inner_child in child.children:
                         if inner_child.name:
-                            content, key, start, tables, title, all_text = extract_fields(all_text, inner_child,
-                                                                                          content, key,
-                                                                                          start,
-                                                                                          statute,
-                                                                                          tables, title)
+                            sections.feed(inner_child)
                 else:
-                    content, key, start, tables, title, all_text = extract_fields(all_text, child, content, key, start,
-                                                                                  statute,
-                                                                                  tables, title)
-
-        if start:
-            statute.add_section(title=title, content=content, key=key, tables=tables)
+                    sections.feed(child)
+        sections.flush()
 
 
 def add_image(src, title, count):
-    return {
-        "altText": title,
-        "link": src,
-        "name": 'image_' + str(count)
-    }
-
-
-def extract_schedule(soup, statute):
-    doc_container = soup.find(class_='DocContainer')
-    content = ""
-    tables = []
-    title = ""
-    images = []
-    start = False
+    return Image(altText=title, link=src, name='image_' + str(count))
+
+
+def extract_schedule(index, statute):
+    doc_container = index.find('DocContainer')
     if doc_container:
+        schedule = ScheduleExtractor(index, statute)
         for child in doc_container.children:
             if child.name:
-                image = child.find(class_=re.compile(r'^LegDisplayImage'))
-                if image:
-                    images.append(add_image(image.get('src'), title, len(images) + 1))
-                child_class = child.get('class')
-                extract_table(child, child_class, tables)
-                if child_class and any(re.search(r'LegSchedule', cls) for cls in child_class):
-                    if not start and child.text:
-                        title = child.text.strip()
-                    start = True
-                if start and child.text.strip():
-                    content += extract_space(child.text.strip()) + '\n'
-        statute.add_schedule(content=content, tables=tables, images=images)
-
-
-def extract_fields(all_text, child, content, key, start, statute, tables, title):
-    child_class = child.get('class')
-    child_id = child.get('id')
-    text = child.text.strip().lower()
-    if (re.match(
-            r'^h[1-6]+', child.name) and text and re.match(
-        r'^section *[0-9]+', text)) or (child_id and re.match(r'^section[- ][0-9]+$', child_id)):
-        if start:
-            statute.add_section(title=title, content=content, key=key, tables=tables)
-
-        title = ""
-        content = ""
-        tables = []
-        start = True
-        all_text = False
-        if child_id and child_id.split('-') and len(child_id.split('-')) == 2:
-            key = child_id.split('-')[1]
-        else:
-            key = extract_number(text)
-
-    extract_table(child, child_class, tables)
-
-    if start and child.find(class_=re.compile(r'^LegP1GroupTitle|LegPblockTitle')):
-        title = extract_space(child.find(
-            class_=re.compile(r'^LegP1GroupTitle|LegPblockTitle')).text.strip())
-        all_text = True
-    elif all_text:
-        content += extract_space(child.text.strip()) + '\n'
-    return content, key, start, tables, title, all_text
+                schedule.feed(child)
+        schedule.flush()
 
 
 def extract_table(child, child_class, tables):
-    if child_class and any(re.search(r'LegTabular', cls) for cls in child_class):
-        name = child.get('id')
-        rows = []
-        extract_table_content(child, rows, 'thead')
-        extract_table_content(child, rows, 'tbody')
-        extract_table_content(child, rows, 'tfoot')
-        row_count, col_count = get_row_and_col_counts(rows)
-        tables.append({
-            "rowCount": row_count,
-            "colCount": int(math.ceil(col_count)),
-            "name": name,
-            "rows": rows,
-        })
-
-
-def get_row_and_col_counts(rows):
-    col_counts = 0
-    row_count = 0
-    if rows and len(rows) > 0:
-        row_count = len(rows)
-        col_counts = len(rows[0])
-    return row_count, col_counts
-
-
-def extract_table_content(child, rows, class_name):
+    if child_class and any(LEG_TABULAR.search(cls) for cls in child_class):
+        table = Table(name=child.get('id'))
+        extract_table_content(child, table, 'thead')
+        extract_table_content(child, table, 'tbody')
+        extract_table_content(child, table, 'tfoot')
+        tables.append(table)
+
+
+def extract_table_content(child, table_record, class_name):
     table = child.find(class_name)
     if table:
         for table_row in table.children:
@@ -143,7 +273,7 @@ def extract_table_content(child, rows, class_name):
                     if cell.text.strip():
                         row.append(extract_space(cell.text.strip()))
             if len(row) > 0:
-                rows.append(row)
+                table_record.add_row(row)
 
 
 def extract_space_without_newline(text):
@@ -192,33 +322,86 @@ def extract_first_date(text):
 
 
 class ProcessHtml(IProcess):
+    output_encoding = 'utf-8'
+    output_modules = IProcess.output_modules + ('src.parser.json_template', 'src.service.backend')
+
+    def __init__(self, backend=STDLIB, restricted=False, compact=False):
+        # restricted parses only the subtrees the extractors read, see LegislationStrainer,
+        # compact writes the JSON without indentation
+        self.backend = resolve_backend(backend)
+        self.restricted = restricted
+        self.compact = compact
+
+    def fingerprint(self):
+        return (f'{super().fingerprint()}:{self.backend}{":restricted" if self.restricted else ""}'
+                f'{":compact" if self.compact else ""}')
+
     def process_file(self, input_path, output_path):
         # Read HTML content from file
-        with open(input_path, 'r', encoding='utf-8') as file:
+        with span('html.read'), open(input_path, 'r', encoding='utf-8') as file:
             html_content = file.read()
 
-        soup = BeautifulSoup(html_content, 'html.parser')
-
+        statute = self.build_statute(html_content, input_path)
+
+        # Stream the JSON to the output file
+        with span('html.write'), open(output_path, 'w', encoding='utf-8') as file:
+            statute.write_json(file, indent=None if self.compact else 4)
+
+    def convert(self, content, source_name=''):
+        statute = self.build_statute(self.decode(content), source_name)
+        with span('html.encode'):
+            return statute.to_json(indent=None if self.compact else 4)
+
+    def convert_record(self, content, source_name=''):
+        statute = self.build_statute(self.decode(content), source_name)
+        with span('html.encode'):
+            return statute.statuteId or source_name, statute.to_json_line(source_name)
+
+    @staticmethod
+    def decode(content):
+        if isinstance(content, bytes):
+            # Decode like the text mode read in process_file, universal newlines included
+            content = content.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+        return content
+
+    def build_statute(self, html_content, input_path):
+        with span('html.parse'):
+            soup = BeautifulSoup(html_content, html_parser_name(self.backend),
+                                 parse_only=LegislationStrainer() if self.restricted else None)
+        with span('html.index'):
+            index = SoupIndex(soup)
+
+        with span('html.metadata'):
+            statute = self.extract_statute(index, input_path)
+        with span('html.sections'):
+            get_section(index, statute)
+        with span('html.schedule'):
+            extract_schedule(index, statute)
+        return statute
+
+    def extract_statute(self, index, input_path):
         # Extracting information
-        title = soup.find('title').text.strip() if soup.find('title') else ""  #okay
+        title_element = index.find_name('title')
+        title = title_element.text.strip() if title_element else ""  #okay
 
+        date_element = index.find(LEG_DATE_OF_ENACTMENT, name='p')
         effective_date = convert_date(
-            re.sub(r'[\[\]]', ' ', soup.find('p', class_=re.compile(r'^LegDateOfEnactment')).text).strip() if soup.find(
-                'p', class_=re.compile(r'^LegDateOfEnactment')) else "", input_path)  # okay
+            re.sub(r'[\[\]]', ' ', date_element.text).strip() if date_element else "", input_path)  # okay
 
-        list_of_sections = get_list_sections(soup)  # okay
+        list_of_sections = get_list_sections(index)  # okay
 
-        preamble = soup.find(class_='LegLongTitle').text.strip() if soup.find(class_='LegLongTitle') else ""  # okay
+        long_title = index.find('LegLongTitle')
+        preamble = long_title.text.strip() if long_title else ""  # okay
 
         pre_sections_text = re.sub(r'\s{2,}', ' ',
-                                   re.sub(r'\s*\n\s*', ' ', soup.find(class_='LegPrelims').text.strip() if soup.find(
-                                       class_='LegLongTitle') else ""))  # okay
+                                   re.sub(r'\s*\n\s*', ' ', index.find('LegPrelims').text.strip() if long_title
+                                          else ""))  # okay
 
-        statute_id = extract_space(soup.find(class_='LegNo').text.strip() if soup.find(
-            class_='LegNo') else "")  # okay
+        leg_no = index.find('LegNo')
+        statute_id = extract_space(leg_no.text.strip() if leg_no else "")  # okay
 
         # Initialize Statute instance
-        statute = Statute(
+        return Statute(
             title=title,
             listOfSections=list_of_sections,
             preamble=preamble,
@@ -226,10 +409,3 @@ class ProcessHtml(IProcess):
             preSectionsText=pre_sections_text,
             statuteId=statute_id,
         )
-        get_section(soup, statute)
-        extract_schedule(soup, statute)
-        json_content = statute.to_json()
-
-        # Write to output file
-        with open(output_path, 'w', encoding='utf-8') as file:
-            file.write(json_content)
@@ -1,15 +1,64 @@
-import xml
-import xml.etree.ElementTree as et
-from jinja2 import Template
+import io
+import os
 import re
 
-from src.parser.html_template import html_template
+from src.helpers.profiling import span
+from src.parser.templates import get_template
+from src.service.backend import STDLIB, iterparse_xml, parse_xml, resolve_backend
 from src.service.process import IProcess
 
 namespaces = {
     'akomaNtoso': 'http://docs.oasis-open.org/legaldocml/ns/akn/3.0',
     'uk': 'https://caselaw.nationalarchives.gov.uk/akn'
 }
+AKN = '{' + namespaces['akomaNtoso'] + '}'
+BR = AKN + 'br'
+
+
+class DocumentIndex:
+    # Maps every namespaced tag of a document to its elements in document order, built in one
+    # traversal so the helpers below do dictionary lookups instead of rescanning the tree
+    def __init__(self, root=None):
+        self.elements = {}
+        self._header_paragraphs = None
+        self._inner_text = {}
+        self._plain_text = {}
+        if root is not None:
+            for element in root.iter():
+                self.add(element)
+
+    def add(self, element):
+        found = self.elements.get(element.tag)
+        if found is None:
+            self.elements[element.tag] = [element]
+        else:
+            found.append(element)
+
+    def find(self, name):
+        found = self.elements.get(AKN + name)
+        return found[0] if found else None
+
+    def findall(self, name):
+        return self.elements.get(AKN + name, [])
+
+    def header_paragraphs(self):
+        if self._header_paragraphs is None:
+            header = self.find('header')
+            self._header_paragraphs = [p for p in header.iter(AKN + 'p') if p is not header]
+        return self._header_paragraphs
+
+    # Text is memoized per element so the header helpers share one extraction per paragraph
+    def inner_text(self, element):
+        text = self._inner_text.get(element)
+        if text is None:
+            text = self._inner_text[element] = element_inner_text(element)
+        return text
+
+    def plain_text(self, element):
+        text = self._plain_text.get(element)
+        if text is None:
+            text = self._plain_text[element] = element_plain_text(element)
+        return text
 
 
 def get_case_id(header):
@@ -50,7 +99,7 @@ def extract_specific_text(element):
     words = []
 
     for child in element.iter():
-        if child.tag == '{http://docs.oasis-open.org/legaldocml/ns/akn/3.0}br':
+        if child.tag == BR:
             if words:
                 paragraphs.append(create_paragraph(' '.join(words)))
                 words = []
@@ -64,46 +113,100 @@ def extract_specific_text(element):
     return ' '.join(paragraphs)
 
 
-def get_head_note(header_children):
+def _escape_cdata(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def _append_inner_text(element, parts):
+    # Every tag of the serialized form becomes a space, a bare br is serialized as '<ns0:br />'
+    parts.append(' ')
+    if element.text:
+        parts.append(_escape_cdata(element.text))
+    for child in element:
+        if child.tag == BR and not child.attrib and not child.text and not len(child):
+            parts.append('@')
+        else:
+            _append_inner_text(child, parts)
+        if child.tail:
+            parts.append(_escape_cdata(child.tail))
+    parts.append(' ')
+
+
+def element_inner_text(element):
+    # Same result as extract_inner_text(et.tostring(element)) read straight from the tree: br marks
+    # paragraph breaks with '@', text keeps the escaping and ASCII character references of tostring
+    parts = []
+    _append_inner_text(element, parts)
+    if element.tail:
+        parts.append(_escape_cdata(element.tail))
+    text = ''.join(parts)
+    if not text.isascii():
+        text = text.encode('ascii', 'xmlcharrefreplace').decode('ascii')
+    return ' '.join(text.split())
+
+
+def element_plain_text(element):
+    # Same result as extract_inner_text(extract_specific_text(element)) without building the HTML,
+    # unless the text itself contains markup the regex would strip
+    words = []
+    for child in element.iter():
+        if child.tag != BR:
+            if child.text and child.text.strip():
+                words.append(child.text.strip())
+            if child.tail and child.tail.strip():
+                words.append(child.tail.strip())
+    text = ' '.join(words)
+    if '<' in text:
+        return extract_inner_text(extract_specific_text(element))
+    return ' '.join(text.split())
+
+
+def get_head_note(index):
     notes_map = []
-    for note in header_children.findall('.//akomaNtoso:p', namespaces):
-        text = extract_inner_text(xml.etree.ElementTree.tostring(element=note))
+    for note in index.header_paragraphs():
+        text = index.inner_text(note)
         if len(re.sub(r'[^a-zA-Z]', '', text)) > 0:
             notes_map.append(replace_with_p(text))
     return ' '.join(notes_map)
 
 
-def get_case_no(header_children):
+def get_case_no(index):
     notes_map = ''
-    for note in header_children.findall('.//akomaNtoso:p', namespaces):
-        p_text = extract_inner_text(xml.etree.ElementTree.tostring(element=note))
+    for note in index.header_paragraphs():
+        p_text = index.inner_text(note)
         if 'Case No:' in p_text:
             notes_map = p_text.replace('Case No:', '').strip()
     return notes_map
 
 
-def get_parties(parties_root):
-    parties_element = parties_root.find('.//akomaNtoso:header', namespaces)
+def get_parties(index):
+    parties_element = index.find('header')
     judges_map = []
     for party in parties_element.iter():
         if party.tag.endswith('role') or party.tag.endswith('party'):
             judges_map.append(extract_specific_text(party))
-    return ''.join(judges_map) if judges_map and len(judges_map) >= 3 else extract_to_p(parties_root)
+    return ''.join(judges_map) if judges_map and len(judges_map) >= 3 else extract_to_p(index)
 
 
-def extract_to_p(parties_root):
-    title = get_title(parties_root)
+def extract_to_p(index):
+    title = get_title(index)
     text = re.split(r' [Vv] ', title)
     return (create_paragraph(text[0]) + create_paragraph("v") + create_paragraph(text[1])) if len(text) > 1 \
         else create_paragraph(title)
 
 
-def get_judges(judges_root):
-    judges_element = judges_root.findall('.//akomaNtoso:judge', namespaces)
+def get_judges(index):
+    judges_element = index.findall('judge')
     judges_map = []
     for judge in judges_element:
         judges_map.append(create_paragraph(judge.text))
-    return ''.join(judges_map) if judges_map else get_judges_from_header(judges_root)
+    return ''.join(judges_map) if judges_map else get_judges_from_header(index)
 
 
 def is_username_valid(username):
@@ -118,12 +221,12 @@ def is_username_valid(username):
     return True
 
 
-def get_judges_from_header(judges_root, take_one=False):
-    judges_element = judges_root.find('.//akomaNtoso:header', namespaces).findall('.//akomaNtoso:p', namespaces)
+def get_judges_from_header(index, take_one=False):
+    judges_element = index.header_paragraphs()
     judges_map = []
     start = False
     for judge in judges_element:
-        inner_text = extract_inner_text(extract_specific_text(judge))
+        inner_text = index.plain_text(judge)
         if inner_text.lower().strip().startswith("between"):
             break
         if start:
@@ -141,14 +244,73 @@ def get_judges_from_header(judges_root, take_one=False):
 def get_content(contents_element):
     judges_map = []
     for element_content in list(contents_element):
-        content_tag = element_content.tag
-        if content_tag.endswith('paragraph'):
-            judges_map.extend(handle_paragraph(element_content))
-        elif content_tag.endswith('level'):
-            judges_map.append(create_div(handle_level(element_content)))
+        rendered = render_content_element(element_content)
+        if rendered is not None:
+            judges_map.append(rendered)
     return ''.join(judges_map) if judges_map else ''
 
 
+def render_content_element(element_content):
+    content_tag = element_content.tag
+    if content_tag.endswith('paragraph'):
+        return handle_paragraph(element_content)
+    elif content_tag.endswith('level'):
+        return create_div(handle_level(element_content))
+    return None
+
+
+# Subtrees kept whole while streaming, the metadata helpers read them once the document is done
+STREAM_RETAINED = {AKN + 'meta', AKN + 'header'}
+# Elements looked up through the index outside of the retained subtrees
+STREAM_INDEXED = {AKN + 'decision', AKN + 'judge', AKN + 'neutralCitation', AKN + 'FRBRname', AKN + 'FRBRdate',
+                  AKN + 'TLCOrganization'}
+
+
+def stream_document(source, backend=STDLIB):
+    # Render the decision while parsing: each direct child of the first decision is rendered as soon as
+    # it is complete and then dropped, as is everything outside meta and header, so memory stays flat
+    index = DocumentIndex()
+    rendered = []
+    decision = None
+    decision_depth = None
+    parents = []
+    retained_depth = 0
+    for event, element in iterparse_xml(source, ('start', 'end'), backend):
+        if event == 'start':
+            if retained_depth or element.tag in STREAM_RETAINED:
+                retained_depth += 1
+                index.add(element)
+            elif element.tag in STREAM_INDEXED:
+                index.add(element)
+            if decision is None and element.tag == AKN + 'decision':
+                decision = element
+                decision_depth = len(parents)
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if retained_depth:
+            retained_depth -= 1
+            continue
+        if not parents:
+            break
+        if decision_depth is not None:
+            # Children of a decision child stay attached until the whole paragraph or level is rendered
+            if len(parents) > decision_depth + 1:
+                continue
+            if len(parents) == decision_depth + 1:
+                content = render_content_element(element)
+                if content is not None:
+                    rendered.append(content)
+            else:
+                decision_depth = None
+        parents[-1].remove(element)
+
+    if decision is None:
+        raise ValueError(f'No decision element in {source}')
+    return index, ''.join(rendered)
+
+
 def handle_level(element_content):
     children = list(element_content)
     level = []
@@ -169,22 +331,22 @@ def handle_paragraph(paragraph):
             cleaned_text = re.sub(r'\W+', '', text)
             dev_id = cleaned_text.strip()
         else:
-            dev_text = extract_inner_text(extract_specific_text(child))
+            dev_text = element_plain_text(child)
     return create_p_with_id(dev_text, id=dev_id)
 
 
-def get_first_judge(judge_elements):
-    all_judges = get_judges(judge_elements)
+def get_first_judge(index):
+    all_judges = get_judges(index)
     return all_judges[0] if all_judges else None
 
 
-def get_title(root):
-    return root.find('.//akomaNtoso:FRBRname', namespaces).attrib.get('value') if root.find(
-        './/akomaNtoso:FRBRname', namespaces) is not None else ''
+def get_title(index):
+    title_element = index.find('FRBRname')
+    return title_element.attrib.get('value') if title_element is not None else ''
 
 
-def get_cort_name(root):
-    cort_element = root.find('.//akomaNtoso:TLCOrganization', namespaces)
+def get_cort_name(index):
+    cort_element = index.find('TLCOrganization')
     if cort_element is not None:
         return create_paragraph(cort_element.attrib.get('shortForm')) if cort_element.attrib.get(
             'shortForm') is not None else create_paragraph(cort_element.attrib.get('showAs'))
@@ -192,34 +354,86 @@ def get_cort_name(root):
 
 
 class ProcessXML(IProcess):
+    output_modules = IProcess.output_modules + ('src.parser.templates', 'src.parser.html_template',
+                                                'src.service.backend')
+
+    def __init__(self, template_path=None, template_cache=None, stream_threshold=None, backend=STDLIB):
+        # template_path renders with an alternate Jinja template from disk instead of html_template,
+        # template_cache is a directory for Jinja's compiled bytecode of such templates.
+        # Files of at least stream_threshold bytes are rendered with iterparse instead of a full tree.
+        self.template_path = template_path
+        self.template_cache = template_cache
+        self.stream_threshold = stream_threshold
+        self.backend = resolve_backend(backend)
+
+    def fingerprint(self):
+        return f'{super().fingerprint()}:{self.template_path or "builtin"}:{self.backend}'
+
+    def output_sources(self):
+        return super().output_sources() + ([self.template_path] if self.template_path else [])
+
+    def warm(self):
+        get_template(self.template_path, self.template_cache)
+
     def process_file(self, xml_path, output_path):
-        # Parse XML file
-        tree = et.parse(xml_path)
-        root = tree.getroot()
+        html_content = self.render_source(xml_path, os.path.getsize(xml_path))
 
-        # Extract content using namespace
-        title = create_paragraph(get_title(root))
-        date = create_paragraph(root.find('.//akomaNtoso:FRBRdate', namespaces).attrib.get('date')) if root.find(
-            './/akomaNtoso:FRBRdate', namespaces) is not None else ''
-        source = create_paragraph('UK CASE LAW NATIONAL ARCHIVES')
-        court = get_cort_name(root)
-        court_location = create_paragraph('United Kingdom')
-        media_nuetral_citation = create_paragraph(
-            root.find('.//akomaNtoso:neutralCitation', namespaces).text) if root.find(
-            './/akomaNtoso:neutralCitation', namespaces) is not None else ''
-        headnotes = get_head_note(root.find('.//akomaNtoso:header', namespaces))
-        content = get_content(root.find('.//akomaNtoso:decision', namespaces))
-        case_id = get_case_no(root.find('.//akomaNtoso:header', namespaces))
+        # Write to output HTML file
+        with span('xml.write'), open(output_path, 'w') as file:
+            file.write(html_content)
 
-        judges = get_judges(root)
-        presiding_judge = create_paragraph(root.find('.//akomaNtoso:judge', namespaces).text) if root.find(
-            './/akomaNtoso:judge', namespaces) is not None else get_judges_from_header(root, True)
+    def convert(self, content, source_name=''):
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return self.render_source(io.BytesIO(content), len(content))
 
-        parties = get_parties(root)
+    def render_source(self, source, size):
+        # source is a path or a binary file object holding `size` bytes of XML
+        if self.stream_threshold is not None and size >= self.stream_threshold:
+            with span('xml.stream'):
+                index, content = stream_document(source, self.backend)
+        else:
+            # Parse XML file
+            with span('xml.parse'):
+                index = DocumentIndex(parse_xml(source, self.backend))
+            with span('xml.content'):
+                content = get_content(index.find('decision'))
+
+        return self.render(index, content)
+
+    def render(self, index, content):
+        with span('xml.metadata'):
+            fields = self.extract_fields(index)
 
         # Render HTML using the template
-        template = Template(html_template)
-        html_content = template.render(
+        with span('xml.template'):
+            template = get_template(self.template_path, self.template_cache)
+            return template.render(content=content, **fields)
+
+    def extract_fields(self, index):
+        # Extract content using namespace
+        title = create_paragraph(get_title(index))
+        date_element = index.find('FRBRdate')
+        date = create_paragraph(date_element.attrib.get('date')) if date_element is not None else ''
+        source = create_paragraph('UK CASE LAW NATIONAL ARCHIVES')
+        court = get_cort_name(index)
+        court_location = create_paragraph('United Kingdom')
+        citation_element = index.find('neutralCitation')
+        media_nuetral_citation = create_paragraph(citation_element.text) if citation_element is not None else ''
+        with span('xml.head_note'):
+            headnotes = get_head_note(index)
+            case_id = get_case_no(index)
+
+        with span('xml.judges'):
+            judges = get_judges(index)
+            judge_element = index.find('judge')
+            presiding_judge = create_paragraph(judge_element.text) if judge_element is not None \
+                else get_judges_from_header(index, True)
+
+        with span('xml.parties'):
+            parties = get_parties(index)
+
+        return dict(
             title=title,
             date=date,
             case_id=case_id,
@@ -231,9 +445,4 @@ class ProcessXML(IProcess):
             source=source,
             media_nuetral_citation=media_nuetral_citation,
             headnotes=headnotes,
-            content=content
         )
-
-        # Write to output HTML file
-        with open(output_path, 'w') as file:
-            file.write(html_content)
@@ -0,0 +1,72 @@
+import importlib
+
+# Input extension -> module and class of its processor and the extension of the documents it writes
+PROCESSORS = {
+    '.html': ('src.service.process_html', 'ProcessHtml', '.json'),  # legislature
+    '.xml': ('src.service.process_xml', 'ProcessXML', '.html'),  # case
+}
+
+
+class ProcessorRegistry:
+    # Dispatches files to processors by extension. A processor module is imported, and its processor built with
+    # its options, the first time a file of that type is met, so a run over Acts alone never loads Jinja and one
+    # over judgments never loads BeautifulSoup.
+    def __init__(self, types=None, options=None, instances=None):
+        # types maps the input extensions to handle to their output extensions, options the input extensions to
+        # the keyword arguments of their processor
+        self.types = dict(types) if types is not None else {key: spec[2] for key, spec in PROCESSORS.items()}
+        self.options = options or {}
+        self.instances = dict(instances or {})
+
+    @classmethod
+    def single(cls, process_object, input_type, out_type):
+        # Wraps one ready built processor, the way run_files was driven before the registry
+        return cls({input_type: out_type}, instances={input_type: process_object})
+
+    def match(self, name):
+        # The longest handled extension the name ends with, None for files that are copied as assets
+        matched = None
+        for input_type in self.types:
+            if name.endswith(input_type) and (matched is None or len(input_type) > len(matched)):
+                matched = input_type
+        return matched
+
+    def output_name(self, path, input_type):
+        # Swaps the extension only, a folder or stem that happens to contain the input type is left alone
+        return path[:len(path) - len(input_type)] + self.types[input_type]
+
+    def processor_class(self, input_type):
+        if input_type in self.instances:
+            return type(self.instances[input_type])
+        module_name, class_name, _ = PROCESSORS[input_type]
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def processor_name(self, input_type):
+        if input_type in self.instances:
+            return type(self.instances[input_type]).__name__
+        return PROCESSORS[input_type][1]
+
+    def output_encoding(self, input_type):
+        return self.processor_class(input_type).output_encoding
+
+    def get(self, input_type):
+        process_object = self.instances.get(input_type)
+        if process_object is None:
+            process_object = self.processor_class(input_type)(**self.options.get(input_type, {}))
+            self.instances[input_type] = process_object
+        return process_object
+
+    def for_path(self, path):
+        return self.get(self.match(path))
+
+    def warm(self):
+        # Imports and builds the processor of every handled type up front, for workers that must not charge
+        # that to their first file
+        for input_type in self.types:
+            self.get(input_type).warm()
+
+
+def as_registry(process_object, input_type=None, out_type=None):
+    if isinstance(process_object, ProcessorRegistry):
+        return process_object
+    return ProcessorRegistry.single(process_object, input_type, out_type)